@@ -1,19 +1,83 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import sqlite3
 import math
-import requests
 import json
 from datetime import datetime, timedelta
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hmac
+import time
 import os
 import ast
+from jobs import JobQueue
+from weather_cache import WeatherCache
+from irradiance import IrradianceStore, fetch_nasa_irradiance, default_summary
+from portfolio import iter_portfolio, evaluate_portfolio, DAYS_IN_MONTH
+from circuit_breaker import CircuitBreaker
+from shading import HorizonStore, parse_horizon_profile, shading_factor
+import export
+import catalog
+from grid_regions import grid_region, DEFAULT_CO2_FACTOR, DEFAULT_ELECTRICITY_RATE
+from meter_data import MeterStore, parse_meter_csv, load_summary
+from gazetteer import Gazetteer, ensure_index, SEED_PATH as GAZETTEER_SEED
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
+DB_PATH = os.environ.get('SOLAR_DB_PATH', 'solar_data.db')
+
+# Background jobs for analyses too slow to run inside a request
+job_queue = JobQueue(DB_PATH)
+
+# Locally stored NASA POWER irradiance, see prefetch.py. Points without a
+# stored grid cell reuse neighbours within IRRADIANCE_REUSE_KM.
+irradiance_store = IrradianceStore(DB_PATH)
+IRRADIANCE_REUSE_KM = float(os.environ.get('IRRADIANCE_REUSE_KM', 50))
+
+# NASA POWER protection: fail fast while it is down and cap how many requests
+# wait on it at once. Rejected or failed lookups fall back to stored data
+# within IRRADIANCE_FALLBACK_KM before the generic default.
+NASA_POWER_TIMEOUT = float(os.environ.get('NASA_POWER_TIMEOUT', 10))
+IRRADIANCE_FALLBACK_KM = float(os.environ.get('IRRADIANCE_FALLBACK_KM', 500))
+def upstream_failure(exc):
+    # Timeouts, connection errors and 5xx responses count against NASA POWER;
+    # 4xx responses and unusable data are the request's fault
+    import requests
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    return isinstance(exc, (requests.Timeout, requests.ConnectionError))
+
+nasa_breaker = CircuitBreaker('nasa_power',
+                              reset_timeout=float(os.environ.get('NASA_BREAKER_RESET', 30)),
+                              max_concurrent=int(os.environ.get('NASA_MAX_CONCURRENT', 4)),
+                              is_failure=upstream_failure)
+
+# Per-site horizon profiles for shading losses
+horizon_store = HorizonStore(DB_PATH)
+
+# Uploaded smart-meter loads (see meter_data.py), used in place of the
+# appliance list when a calculation names a meter_id
+meter_store = MeterStore(DB_PATH)
+METER_MAX_BYTES = int(os.environ.get('METER_MAX_BYTES', 100 * 1024 * 1024))
+# Meter files are the largest bodies the app accepts. Werkzeug enforces this
+# while reading, so chunked uploads without a Content-Length are cut off too.
+app.config['MAX_CONTENT_LENGTH'] = METER_MAX_BYTES
+
+# Offline place-name autocomplete, see gazetteer.py. The index is built from
+# GAZETTEER_SOURCE (a GeoNames dump, or the bundled seed) when it is missing
+# or older than the source, next to the database unless GAZETTEER_PATH says
+# otherwise.
+GAZETTEER_SOURCE = os.environ.get('GAZETTEER_SOURCE', GAZETTEER_SEED)
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH',
+                                os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'gazetteer.idx'))
+place_index = Gazetteer(GAZETTEER_PATH)
+
 # Initialize database
 def init_db():
-    conn = sqlite3.connect('solar_data.db')
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     # Create tables
@@ -38,9 +102,20 @@ def init_db():
                   co2_savings REAL,
                   calculation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
+    # History export filters by date and session
+    c.execute('CREATE INDEX IF NOT EXISTS idx_calculations_date ON solar_calculations (calculation_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_calculations_session ON solar_calculations (user_session)')
+    
     conn.commit()
     conn.close()
 
+    job_queue.init_db()
+    irradiance_store.init_db()
+    horizon_store.init_db()
+    meter_store.init_db()
+    catalog.init_catalog(DB_PATH)
+    ensure_index(GAZETTEER_PATH, GAZETTEER_SOURCE)
+
 # Solar calculation functions
 def calculate_panel_requirements(appliances_data):
     total_daily_wh = 0
@@ -52,6 +127,9 @@ def calculate_panel_requirements(appliances_data):
         daily_consumption = wattage * hours * quantity
         total_daily_wh += daily_consumption
     
+    return panel_requirements_for_load(total_daily_wh)
+
+def panel_requirements_for_load(total_daily_wh):
     # Convert to kWh
     total_daily_kwh = total_daily_wh / 1000 if total_daily_wh else 0
     
@@ -66,6 +144,16 @@ def calculate_panel_requirements(appliances_data):
         'recommended_system_size': round(panels_needed * 0.3, 2)
     }
 
+def site_coordinates(data):
+    # (latitude, longitude) from a request body; raises ValueError when out of range
+    latitude = float(data.get('latitude', 0))
+    longitude = float(data.get('longitude', 0))
+    if not -90 <= latitude <= 90:
+        raise ValueError("latitude must be between -90 and 90 degrees")
+    if not -180 <= longitude <= 180:
+        raise ValueError("longitude must be between -180 and 180 degrees")
+    return latitude, longitude
+
 def calculate_optimal_tilt_angle(latitude):
     # Basic formula for optimal tilt angle
     try:
@@ -87,29 +175,49 @@ def calculate_optimal_tilt_angle(latitude):
         'summer_angle': round(summer_angle, 1)
     }
 
-def estimate_solar_production(latitude, longitude, system_size_kw, tilt_angle=None):
-    # Use NASA POWER API for solar data
+# Long-term NASA POWER irradiance summary for one point (mean, monthly means,
+# P50/P90), served from the local store (filled by prefetch.py or earlier
+# requests) when possible. Raises on failure so errors are never cached;
+# callers fall back to a default.
+@lru_cache(maxsize=4096)
+def fetch_irradiance_summary(latitude, longitude):
+    latitude, longitude = site_coordinates({'latitude': latitude, 'longitude': longitude})
+    stored = irradiance_store.lookup(latitude, longitude, max_distance_km=IRRADIANCE_REUSE_KM)
+    if stored is not None:
+        return stored
+    
+    summary = nasa_breaker.call(fetch_nasa_irradiance, latitude, longitude, timeout=NASA_POWER_TIMEOUT)
     try:
-        url = "https://power.larc.nasa.gov/api/temporal/daily/point"
-        params = {
-            'parameters': 'ALLSKY_SFC_SW_DWN',
-            'community': 'RE',
-            'longitude': longitude,
-            'latitude': latitude,
-            'start': '20230101',
-            'end': '20231231',
-            'format': 'JSON'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            solar_values = list(data['properties']['parameter']['ALLSKY_SFC_SW_DWN'].values())
-            avg_solar_irradiance = sum(solar_values) / len(solar_values) if solar_values else 4.5
-        else:
-            avg_solar_irradiance = 4.5  # Default fallback
+        irradiance_store.put(latitude, longitude, summary)
+    except sqlite3.Error:
+        pass  # the value is still good for this request
+    return summary
+
+# Never raises: upstream outages degrade to the best local data. Fallbacks are
+# flagged with 'fallback' and must not be cached, so the real value is picked
+# up once the upstream recovers.
+def get_irradiance_summary(latitude, longitude):
+    try:
+        return fetch_irradiance_summary(float(latitude), float(longitude))
     except Exception:
-        avg_solar_irradiance = 4.5  # Default fallback
+        pass
+    
+    try:
+        nearby = irradiance_store.lookup(latitude, longitude, max_distance_km=IRRADIANCE_FALLBACK_KM)
+    except (TypeError, ValueError):
+        nearby = None
+    fallback = nearby if nearby is not None else default_summary(4.5)  # Default fallback
+    return dict(fallback, fallback=True)
+
+def estimate_solar_production(latitude, longitude, system_size_kw, tilt_angle=None, horizon=None, irradiance=None):
+    # Use NASA POWER API for solar data (unless the caller already resolved it)
+    if irradiance is None:
+        irradiance = get_irradiance_summary(latitude, longitude)
+    avg_solar_irradiance = irradiance['avg_irradiance']
+    
+    # Beam irradiance blocked by nearby buildings/terrain
+    shading = shading_factor(latitude, horizon) if horizon else 1.0
+    avg_solar_irradiance *= shading
     
     # Calculate daily production (kWh)
     system_efficiency = 0.85  # Account for inverter losses, wiring, etc.
@@ -123,13 +231,27 @@ def estimate_solar_production(latitude, longitude, system_size_kw, tilt_angle=No
     weekly_production = daily_production * 7
     monthly_production = daily_production * 30
     
-    return {
+    production = {
         'daily_kwh': round(daily_production, 2),
         'weekly_kwh': round(weekly_production, 2),
         'monthly_kwh': round(monthly_production, 2),
         'yearly_kwh': round(daily_production * 365, 2),
         'peak_sun_hours': round(peak_sun_hours, 2)
     }
+    if horizon:
+        production['shading_loss_percent'] = round((1 - shading) * 100, 1)
+    
+    # Long-term statistics: monthly shape and exceedance values (same
+    # irradiance -> energy conversion as above)
+    kwh_per_unit = system_size_kw * shading / 1000 * 24 * system_efficiency
+    if irradiance.get('monthly_mean'):
+        production['monthly_kwh_profile'] = [
+            round((month_mean if month_mean is not None else avg_solar_irradiance / shading) * kwh_per_unit * days, 2)
+            for month_mean, days in zip(irradiance['monthly_mean'], DAYS_IN_MONTH)]
+    if irradiance.get('p50') is not None:
+        production['yearly_kwh_p50'] = round(irradiance['p50'] * kwh_per_unit * 365, 2)
+        production['yearly_kwh_p90'] = round(irradiance['p90'] * kwh_per_unit * 365, 2)
+    return production
 
 def calculate_battery_sizing(daily_consumption_kwh, backup_days=2):
     # Battery sizing with depth of discharge consideration
@@ -143,7 +265,10 @@ def calculate_battery_sizing(daily_consumption_kwh, backup_days=2):
         'estimated_cost': round(total_battery_capacity * 500, 2)  # $500 per kWh estimate
     }
 
-def calculate_cost_and_roi(system_size_kw, battery_capacity_kwh, monthly_consumption_kwh):
+def calculate_cost_and_roi(system_size_kw, battery_capacity_kwh, monthly_consumption_kwh,
+                           electricity_rate=DEFAULT_ELECTRICITY_RATE, monthly_production_kwh=None):
+    # monthly_production_kwh: when given, savings are capped at what the
+    # system produces (only consumption that is actually offset saves money)
     # Cost estimates (USD)
     panel_cost_per_kw = 1000  # $1000 per kW
     inverter_cost = system_size_kw * 200  # $200 per kW
@@ -152,9 +277,11 @@ def calculate_cost_and_roi(system_size_kw, battery_capacity_kwh, monthly_consump
     
     total_system_cost = (system_size_kw * panel_cost_per_kw) + inverter_cost + installation_cost + battery_cost
     
-    # ROI calculation
-    electricity_rate = 0.12  # $0.12 per kWh
-    monthly_savings = monthly_consumption_kwh * electricity_rate
+    # ROI calculation at the regional electricity price (USD per kWh)
+    offset_kwh = monthly_consumption_kwh
+    if monthly_production_kwh is not None:
+        offset_kwh = min(monthly_production_kwh, monthly_consumption_kwh)
+    monthly_savings = offset_kwh * electricity_rate
     yearly_savings = monthly_savings * 12
     
     payback_period = total_system_cost / yearly_savings if yearly_savings > 0 else 0
@@ -170,9 +297,8 @@ def calculate_cost_and_roi(system_size_kw, battery_capacity_kwh, monthly_consump
         'payback_period_years': round(payback_period, 1)
     }
 
-def calculate_co2_savings(yearly_production_kwh):
-    # CO2 emission factor for grid electricity (kg CO2 per kWh)
-    co2_factor = 0.5  # Average global factor
+def calculate_co2_savings(yearly_production_kwh, co2_factor=DEFAULT_CO2_FACTOR):
+    # co2_factor: emission factor of the displaced grid electricity (kg CO2 per kWh)
     yearly_co2_savings = yearly_production_kwh * co2_factor
     
     return {
@@ -196,25 +322,90 @@ def calculate_degradation_forecast(initial_production, years=25):
     
     return forecast
 
-# --- Routes
-@app.route('/api/calculate', methods=['POST'])
-def calculate_solar_system():
-    data = request.get_json()
+# Full system calculation; shared by /api/calculate and the job queue
+# Location-dependent stage: irradiance lookup, horizon and tilt. These don't
+# change when only the appliance list does, so sessions reuse them.
+def resolve_horizon(data):
+    # Horizon profile: inline, or stored for the site
+    if data.get('horizon_profile') is not None:
+        return parse_horizon_profile(data['horizon_profile'])
+    if data.get('site_id') is not None:
+        return horizon_store.get(str(data['site_id']))
+    return None
+
+def location_key(data, horizon):
+    # Keyed on the resolved profile, so a PUT /api/horizon takes effect
+    return (round(float(data.get('latitude', 0)), 4), round(float(data.get('longitude', 0)), 4),
+            json.dumps(horizon))
+
+def resolve_location(data, horizon=None):
+    # The slow, location-dependent inputs (irradiance and horizon); cheap
+    # per-coordinate values such as tilt and grid region are computed by
+    # iter_solar_calculation itself. horizon: the profile, when the caller
+    # has already resolved it
+    latitude, longitude = site_coordinates(data)
+    if horizon is None:
+        horizon = resolve_horizon(data)
     
-    # Extract data
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'horizon': horizon,
+        'irradiance': get_irradiance_summary(latitude, longitude)
+    }
+
+def load_meter(data):
+    # Stored meter summary named by data['meter_id'], or None
+    meter_id = data.get('meter_id')
+    if not meter_id:
+        return None
+    meter = meter_store.get(str(meter_id))
+    if meter is None:
+        raise ValueError(f"Unknown meter_id: {meter_id}")
+    return meter
+
+def iter_solar_calculation(data, resolve=resolve_location):
+    # Yields (section, value) pairs as each part of the result is ready.
+    # Sections that need only the appliances and coordinates come first;
+    # resolve(data) (the irradiance lookup, the slow part) runs only once
+    # those are out.
     appliances = data.get('appliances', [])
-    latitude = float(data.get('latitude', 0))
-    longitude = float(data.get('longitude', 0))
-    budget = data.get('budget', 10000)
+    latitude, longitude = site_coordinates(data)
+    region = grid_region(latitude, longitude)
+    meter = load_meter(data)
     
-    # Perform calculations
-    panel_req = calculate_panel_requirements(appliances)
-    tilt_angles = calculate_optimal_tilt_angle(latitude)
-    production = estimate_solar_production(latitude, longitude, panel_req['recommended_system_size'])
+    # Metered consumption replaces the appliance totals when available
+    if meter is None:
+        panel_req = calculate_panel_requirements(appliances)
+    else:
+        panel_req = panel_requirements_for_load(meter['avg_daily_kwh'] * 1000)
+    yield 'panel_requirements', panel_req
+    if meter is not None:
+        yield 'meter_load', meter
     battery = calculate_battery_sizing(panel_req['total_daily_kwh'])
-    cost_roi = calculate_cost_and_roi(panel_req['recommended_system_size'], battery['recommended_capacity_kwh'], panel_req['total_daily_kwh'] * 30)
-    co2_savings = calculate_co2_savings(production['yearly_kwh'])
-    degradation = calculate_degradation_forecast(production['yearly_kwh'])
+    yield 'battery_sizing', battery
+    yield 'tilt_angles', calculate_optimal_tilt_angle(latitude)
+    yield 'grid_region', dict(region)
+    cost_roi = calculate_cost_and_roi(panel_req['recommended_system_size'], battery['recommended_capacity_kwh'], panel_req['total_daily_kwh'] * 30,
+                                      electricity_rate=region['electricity_rate'])
+    yield 'cost_roi', cost_roi
+    
+    # Maintenance schedule
+    yield 'maintenance_schedule', {
+        'panel_cleaning': 'Every 3-6 months',
+        'inverter_replacement': '10-15 years',
+        'battery_replacement': '8-12 years',
+        'system_inspection': 'Annual'
+    }
+    
+    location = resolve(data)
+    horizon = location['horizon']
+    irradiance = location['irradiance']
+    
+    production = estimate_solar_production(latitude, longitude, panel_req['recommended_system_size'], horizon=horizon, irradiance=irradiance)
+    yield 'production_estimate', production
+    yield 'co2_savings', calculate_co2_savings(production['yearly_kwh'], co2_factor=region['co2_kg_per_kwh'])
+    yield 'degradation_forecast', calculate_degradation_forecast(production['yearly_kwh'])[:10]  # First 10 years
     
     # Grid dependency analysis
     daily_production = production['daily_kwh']
@@ -229,7 +420,7 @@ def calculate_solar_system():
         excess_export = 0
         self_consumption_percent = (daily_production / daily_consumption) * 100 if daily_consumption > 0 else 0
     
-    grid_analysis = {
+    yield 'grid_analysis', {
         'daily_grid_import_kwh': round(grid_import, 2),
         'daily_excess_export_kwh': round(excess_export, 2),
         'self_consumption_percent': round(self_consumption_percent, 1),
@@ -239,8 +430,9 @@ def calculate_solar_system():
     # System comparison (3kW vs 5kW vs optimal)
     comparison = []
     for system_size in [3, 5, panel_req['recommended_system_size']]:
-        sys_production = estimate_solar_production(latitude, longitude, system_size)
-        sys_cost = calculate_cost_and_roi(system_size, battery['recommended_capacity_kwh'] * 0.7, panel_req['total_daily_kwh'] * 30)
+        sys_production = estimate_solar_production(latitude, longitude, system_size, horizon=horizon, irradiance=irradiance)
+        sys_cost = calculate_cost_and_roi(system_size, battery['recommended_capacity_kwh'] * 0.7, panel_req['total_daily_kwh'] * 30,
+                                          electricity_rate=region['electricity_rate'])
         
         comparison.append({
             'system_size_kw': system_size,
@@ -248,30 +440,453 @@ def calculate_solar_system():
             'total_cost': sys_cost['total_cost'],
             'payback_period': sys_cost['payback_period_years']
         })
+    yield 'system_comparison', comparison
+
+def run_solar_calculation(data, location=None):
+    # Whole result at once; location skips resolve_location when the caller
+    # already has it
+    resolve = resolve_location if location is None else (lambda _: location)
+    return dict(iter_solar_calculation(data, resolve))
+
+# Optimization sweep: evaluate a range of system sizes for one site
+SWEEP_MAX_STEPS = int(os.environ.get('SWEEP_MAX_STEPS', 500))
+
+def size_sweep_params(data):
+    # Parsed sweep inputs; raises ValueError (checked at submit time too)
+    site_coordinates(data)
+    min_size = float(data.get('min_size_kw', 1))
+    max_size = float(data.get('max_size_kw', 10))
+    step = max(0.1, float(data.get('step_kw', 0.5)))
+    if not 0 < min_size <= max_size:
+        raise ValueError("min_size_kw must be positive and not above max_size_kw")
+    steps = int((max_size - min_size) / step + 1e-9) + 1
+    if steps > SWEEP_MAX_STEPS:
+        raise ValueError(f"At most {SWEEP_MAX_STEPS} sweep steps; increase step_kw or narrow the range")
+    return min_size, step, steps
+
+def run_size_sweep(data):
+    latitude, longitude = site_coordinates(data)
+    min_size, step, steps = size_sweep_params(data)
+    battery_capacity = float(data.get('battery_capacity_kwh', 0))
+    monthly_consumption = float(data.get('monthly_consumption_kwh', 0))
+    electricity_rate = grid_region(latitude, longitude)['electricity_rate']
     
-    # Maintenance schedule
-    maintenance = {
-        'panel_cleaning': 'Every 3-6 months',
-        'inverter_replacement': '10-15 years',
-        'battery_replacement': '8-12 years',
-        'system_inspection': 'Annual'
-    }
+    sweep = []
+    for i in range(steps):
+        system_size = min_size + i * step
+        sys_production = estimate_solar_production(latitude, longitude, system_size)
+        sys_cost = calculate_cost_and_roi(system_size, battery_capacity, monthly_consumption, electricity_rate=electricity_rate,
+                                          monthly_production_kwh=sys_production['yearly_kwh'] / 12)
+        sweep.append({
+            'system_size_kw': round(system_size, 2),
+            'yearly_production_kwh': sys_production['yearly_kwh'],
+            'total_cost': sys_cost['total_cost'],
+            'payback_period': sys_cost['payback_period_years']
+        })
     
-    result = {
-        'panel_requirements': panel_req,
-        'tilt_angles': tilt_angles,
-        'production_estimate': production,
-        'battery_sizing': battery,
-        'cost_roi': cost_roi,
-        'co2_savings': co2_savings,
-        'grid_analysis': grid_analysis,
-        'degradation_forecast': degradation[:10],  # First 10 years
-        'system_comparison': comparison,
-        'maintenance_schedule': maintenance
-    }
+    # Best candidate: shortest payback among sizes that produce anything; on a
+    # tie the larger system, which offsets more of the consumption
+    candidates = [s for s in sweep if s['yearly_production_kwh'] > 0 and s['payback_period'] > 0]
+    best = min(candidates, key=lambda s: (s['payback_period'], -s['system_size_kw'])) if candidates else None
+    
+    return {'sweep': sweep, 'best': best}
+
+# Larger portfolios posted to /api/portfolio are queued as a background job
+PORTFOLIO_MAX_SITES = int(os.environ.get('PORTFOLIO_MAX_SITES', 100))
+
+# Portfolio run as a background job. Job pool processes are not daemonic, so
+# the job fans its sites out over a process pool of its own, shut down when
+# the job ends.
+def run_portfolio(data):
+    return evaluate_portfolio(data.get('sites', []), run_solar_calculation, warm=fetch_irradiance_summary,
+                              warm_concurrency=nasa_breaker.max_concurrent, shared_pool=False)
+
+job_queue.register('calculate', run_solar_calculation)
+job_queue.register('size_sweep', run_size_sweep, validate=size_sweep_params)
+job_queue.register('portfolio', run_portfolio)
+
+# --- Per-session calculation state
+# Appliances live in the appliances table keyed by user_session; the resolved
+# location stage is kept in-process for a few minutes so an appliance edit
+# only re-runs consumption, sizing, battery, cost and grid.
+SESSION_LOCATION_TTL = int(os.environ.get('SESSION_LOCATION_TTL', 300))
+SESSION_CACHE_SIZE = 10000
+_session_locations = OrderedDict()  # user_session -> (key, location, resolved_at)
+_session_lock = threading.Lock()
+
+def valid_session_id(user_session):
+    return isinstance(user_session, str) and 0 < len(user_session) <= 128
+
+def session_location(user_session, data):
+    horizon = resolve_horizon(data)
+    key = location_key(data, horizon)
+    with _session_lock:
+        cached = _session_locations.get(user_session)
+        if cached and cached[0] == key and time.time() - cached[2] < SESSION_LOCATION_TTL:
+            _session_locations.move_to_end(user_session)
+            return cached[1], True
+    
+    location = resolve_location(data, horizon)
+    if location['irradiance'].get('fallback'):
+        # Degraded irradiance is retried on the next calculation
+        return location, False
+    with _session_lock:
+        _session_locations[user_session] = (key, location, time.time())
+        _session_locations.move_to_end(user_session)
+        while len(_session_locations) > SESSION_CACHE_SIZE:
+            _session_locations.popitem(last=False)
+    return location, False
+
+def appliance_row(appliance):
+    hours = appliance.get('hours') or appliance.get('hours_per_day') or 0
+    return (str(appliance.get('name') or 'Appliance'), float(appliance.get('wattage', 0) or 0),
+            float(hours), int(appliance.get('quantity', 1) or 1))
+
+def load_session_appliances(conn, user_session):
+    rows = conn.execute("SELECT id, name, wattage, hours_per_day, quantity FROM appliances WHERE user_session = ? ORDER BY id",
+                        (user_session,)).fetchall()
+    return [{'id': r[0], 'name': r[1], 'wattage': r[2], 'hours_per_day': r[3], 'quantity': r[4]} for r in rows]
+
+def insert_appliances(conn, user_session, appliances):
+    # Returns {client_id: id} for rows the client wants to track
+    appliance_ids = {}
+    for appliance in appliances:
+        cursor = conn.execute("INSERT INTO appliances (name, wattage, hours_per_day, quantity, user_session) VALUES (?, ?, ?, ?, ?)",
+                              appliance_row(appliance) + (user_session,))
+        if appliance.get('client_id') is not None:
+            appliance_ids[str(appliance['client_id'])] = cursor.lastrowid
+    return appliance_ids
+
+def replace_session_appliances(user_session, appliances):
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        conn.execute("DELETE FROM appliances WHERE user_session = ?", (user_session,))
+        appliance_ids = insert_appliances(conn, user_session, appliances)
+    stored = load_session_appliances(conn, user_session)
+    conn.close()
+    return stored, appliance_ids
+
+def apply_appliance_delta(user_session, added, removed, changed):
+    conn = sqlite3.connect(DB_PATH)
+    with conn:
+        for appliance_id in removed:
+            conn.execute("DELETE FROM appliances WHERE id = ? AND user_session = ?", (int(appliance_id), user_session))
+        for appliance in changed:
+            conn.execute("UPDATE appliances SET name = ?, wattage = ?, hours_per_day = ?, quantity = ? WHERE id = ? AND user_session = ?",
+                         appliance_row(appliance) + (int(appliance['id']), user_session))
+        appliance_ids = insert_appliances(conn, user_session, added)
+    stored = load_session_appliances(conn, user_session)
+    conn.close()
+    return stored, appliance_ids
+
+def record_calculation(user_session, latitude, longitude, result):
+    # Calculation history (see export.py); a failed write never fails the request
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute('''INSERT INTO solar_calculations
+                        (user_session, latitude, longitude, total_daily_consumption, panels_needed,
+                         battery_capacity, system_cost, payback_period, co2_savings)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     (user_session, latitude, longitude,
+                      result['panel_requirements']['total_daily_kwh'], result['panel_requirements']['panels_needed'],
+                      result['battery_sizing']['recommended_capacity_kwh'], result['cost_roi']['total_cost'],
+                      result['cost_roi']['payback_period_years'], result['co2_savings']['yearly_co2_savings_kg']))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error:
+        app.logger.exception('Could not record calculation')
+
+# --- Routes
+@app.route('/api/calculate', methods=['POST'])
+def calculate_solar_system():
+    data = request.get_json()
+    user_session = data.get('user_session') if isinstance(data, dict) else None
+    
+    try:
+        if not valid_session_id(user_session):
+            location = resolve_location(data)
+            result = run_solar_calculation(data, location=location)
+            record_calculation(None, location['latitude'], location['longitude'], result)
+            return jsonify(result)
+        
+        # Session calculation: remember the appliances for later deltas
+        appliances, appliance_ids = replace_session_appliances(user_session, data.get('appliances', []))
+        location, _ = session_location(user_session, data)
+        result = run_solar_calculation(dict(data, appliances=appliances), location=location)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    record_calculation(user_session, location['latitude'], location['longitude'], result)
+    result['appliances'] = appliances
+    result['appliance_ids'] = appliance_ids
+    return jsonify(result)
+
+@app.route('/api/calculate/delta', methods=['POST'])
+def calculate_solar_delta():
+    # Body: user_session, latitude/longitude (and horizon inputs) plus
+    # 'added' appliances, 'removed' appliance ids and 'changed' appliances
+    # (with their id). Location-dependent stages are reused when unchanged.
+    data = request.get_json() or {}
+    user_session = data.get('user_session')
+    if not valid_session_id(user_session):
+        return jsonify({'error': 'user_session is required'}), 400
+    
+    try:
+        appliances, appliance_ids = apply_appliance_delta(user_session, data.get('added', []),
+                                                          data.get('removed', []), data.get('changed', []))
+        location, reused = session_location(user_session, data)
+        result = run_solar_calculation(dict(data, appliances=appliances), location=location)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid delta: {e}'}), 400
+    
+    record_calculation(user_session, location['latitude'], location['longitude'], result)
+    result['appliances'] = appliances
+    result['appliance_ids'] = appliance_ids
+    result['reused_location'] = reused
+    return jsonify(result)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/api/calculate/stream', methods=['POST'])
+def calculate_solar_stream():
+    # Same body as /api/calculate, answered as server-sent events: one
+    # 'section' event ({name, value}) per part of the result as soon as it is
+    # computed, then 'done' (or 'error'). The appliance-only sections arrive
+    # before the irradiance lookup has finished.
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON body required'}), 400
+    user_session = data.get('user_session')
+    
+    done = {}
+    resolved = {}
+    try:
+        if valid_session_id(user_session):
+            appliances, appliance_ids = replace_session_appliances(user_session, data.get('appliances', []))
+            data = dict(data, appliances=appliances)
+            done = {'appliances': appliances, 'appliance_ids': appliance_ids}
+            resolve = lambda d: session_location(user_session, d)[0]
+        else:
+            user_session = None
+            resolve = resolve_location
+        # Bad coordinates or meter ids are rejected here, before the stream starts
+        site_coordinates(data)
+        load_meter(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def resolve_and_keep(d):
+        resolved['location'] = resolve(d)
+        return resolved['location']
+    
+    def generate():
+        result = {}
+        try:
+            for name, value in iter_solar_calculation(data, resolve_and_keep):
+                result[name] = value
+                yield sse_event('section', {'name': name, 'value': value})
+        except ValueError as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        except Exception:
+            # The 200 headers are already sent; report it in the stream
+            app.logger.exception('Streamed calculation failed')
+            yield sse_event('error', {'error': 'Calculation failed'})
+            return
+        location = resolved['location']
+        record_calculation(user_session, location['latitude'], location['longitude'], result)
+        yield sse_event('done', done)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/geocode', methods=['GET'])
+def geocode():
+    # Autocomplete: ?q=faisal -> matching places with coordinates
+    if not place_index.available():
+        return jsonify({'error': 'Place index not available'}), 503
+    try:
+        limit = min(int(request.args.get('limit', 10)), 20)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'places': place_index.search(request.args.get('q', ''), limit)})
+
+@app.route('/api/catalog/<kind>', methods=['GET'])
+def search_catalog(kind):
+    # ?q=free text&min_wattage=&max_price=... (see catalog.PANEL_RANGES / INVERTER_RANGES)
+    if kind not in ('panels', 'inverters'):
+        return jsonify({'error': 'kind must be panels or inverters'}), 404
+    
+    ranges = {name: value for name, value in request.args.items() if name.startswith(('min_', 'max_'))}
+    try:
+        limit = min(int(request.args.get('limit', catalog.SEARCH_LIMIT)), 500)
+        items = catalog.search(DB_PATH, kind, text=request.args.get('q'), ranges=ranges, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': items, 'count': len(items)})
+
+@app.route('/api/equipment', methods=['POST'])
+def select_equipment():
+    # Panel + inverter(s) with valid string lengths for the site's temperature
+    # range. Size from system_size_kw, or from the appliance list. Large
+    # arrays are split over several inverters; a DC/AC ratio outside the
+    # usual range is reported in 'warnings'.
+    data = request.get_json() or {}
+    try:
+        latitude, _ = site_coordinates(data)
+        if data.get('system_size_kw') is not None:
+            system_size_kw = float(data['system_size_kw'])
+        else:
+            system_size_kw = calculate_panel_requirements(data.get('appliances', []))['recommended_system_size']
+        t_min, t_max = catalog.site_temperatures(latitude, data.get('min_temp_c'), data.get('max_temp_c'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if system_size_kw <= 0:
+        return jsonify({'error': 'system size must be positive'}), 400
+    
+    selection = catalog.select_equipment(DB_PATH, system_size_kw, t_min, t_max,
+                                         panel_id=data.get('panel_id'), inverter_id=data.get('inverter_id'))
+    if selection is None:
+        return jsonify({'error': 'No compatible panel/inverter combination in the catalog'}), 404
+    
+    selection['system_size_kw'] = system_size_kw
+    selection['site_temperatures'] = {'min_c': round(t_min, 1), 'max_c': round(t_max, 1)}
+    return jsonify(selection)
+
+# The history holds every user's coordinates and session ids (the session id
+# is what authorizes /api/calculate/delta), so the HTTP export is only
+# served to callers presenting EXPORT_TOKEN in the X-Export-Token header.
+# Without a configured token it is disabled; use `python export.py` instead.
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+
+@app.route('/api/export', methods=['GET'])
+def export_calculations():
+    # Streams calculation history; filters: start, end, session and a
+    # min_lat/max_lat/min_lon/max_lon region box
+    if not EXPORT_TOKEN:
+        return jsonify({'error': 'Export is disabled; set EXPORT_TOKEN on the server'}), 403
+    token = request.headers.get('X-Export-Token', '')
+    if not hmac.compare_digest(token.encode(), EXPORT_TOKEN.encode()):
+        return jsonify({'error': 'Invalid or missing X-Export-Token'}), 401
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'parquet'):
+        return jsonify({'error': 'format must be csv or parquet'}), 400
+    if fmt == 'parquet' and not export.parquet_available():
+        return jsonify({'error': 'Parquet export requires pyarrow on the server'}), 501
+    
+    filters = {name: request.args.get(name) for name in export.FILTERS}
+    try:
+        export.build_query(filters)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+    
+    def generate():
+        stats = {}
+        yield from export.export(DB_PATH, filters, fmt, stats=stats)
+        app.logger.info('Exported %d rows (%d bytes) in %.2fs', stats['rows'], stats['bytes'], stats['seconds'])
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    headers = {'Content-Disposition': f'attachment; filename=solar_calculations.{fmt}'}
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
+@app.route('/api/meter', methods=['POST'])
+def upload_meter_data():
+    # Smart-meter interval CSV as a multipart 'file' upload or the raw body.
+    # Returns a meter_id to pass to /api/calculate instead of appliances.
+    # Bodies over METER_MAX_BYTES are rejected (413) through MAX_CONTENT_LENGTH.
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    day_first = str(request.values.get('day_first', '')).lower() in ('1', 'true', 'yes')
+    try:
+        summary = load_summary(parse_meter_csv(stream, day_first=day_first))
+    except ValueError as e:
+        return jsonify({'error': f'Could not read meter data: {e}'}), 400
+    
+    user_session = request.values.get('user_session')
+    meter_id = meter_store.put(summary, user_session if valid_session_id(user_session) else None)
+    return jsonify({'meter_id': meter_id, 'summary': summary})
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Request body larger than {METER_MAX_BYTES} bytes'}), 413
+
+@app.route('/api/meter/<meter_id>', methods=['GET'])
+def get_meter_data(meter_id):
+    summary = meter_store.get(meter_id)
+    if summary is None:
+        return jsonify({'error': 'Meter data not found'}), 404
+    return jsonify({'meter_id': meter_id, 'summary': summary})
+
+@app.route('/api/meter/<meter_id>', methods=['DELETE'])
+def delete_meter_data(meter_id):
+    if not meter_store.delete(meter_id):
+        return jsonify({'error': 'Meter data not found'}), 404
+    return jsonify({'meter_id': meter_id, 'deleted': True})
+
+@app.route('/api/horizon/<site_id>', methods=['PUT'])
+def save_horizon_profile(site_id):
+    data = request.get_json() or {}
+    try:
+        elevations = parse_horizon_profile(data.get('elevations'))
+        latitude = data.get('latitude')
+        if latitude is not None:
+            try:
+                latitude = float(latitude)
+            except (TypeError, ValueError):
+                raise ValueError("latitude must be a number")
+            if not -90 <= latitude <= 90:
+                raise ValueError("latitude must be between -90 and 90 degrees")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    horizon_store.put(site_id, elevations)
+    result = {'site_id': site_id, 'elevations': elevations}
+    if latitude is not None:
+        result['shading_loss_percent'] = round((1 - shading_factor(latitude, elevations)) * 100, 1)
     return jsonify(result)
 
+@app.route('/api/horizon/<site_id>', methods=['GET'])
+def get_horizon_profile(site_id):
+    elevations = horizon_store.get(site_id)
+    if elevations is None:
+        return jsonify({'error': 'No horizon profile for this site'}), 404
+    return jsonify({'site_id': site_id, 'elevations': elevations})
+
+@app.route('/api/horizon/<site_id>', methods=['DELETE'])
+def delete_horizon_profile(site_id):
+    if not horizon_store.delete(site_id):
+        return jsonify({'error': 'No horizon profile for this site'}), 404
+    return jsonify({'site_id': site_id, 'deleted': True})
+
+OPENWEATHER_URL = os.environ.get('OPENWEATHER_URL', "http://api.openweathermap.org/data/2.5/weather")
+
+def fetch_current_weather(latitude, longitude):
+    import requests
+    
+    # OpenWeatherMap free API (you'll need to get a free API key)
+    api_key = os.environ.get('OPENWEATHER_API_KEY', 'your_free_api_key_here')
+    url = f"{OPENWEATHER_URL}?lat={latitude}&lon={longitude}&appid={api_key}&units=metric"
+    
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    weather_data = response.json()
+    return {
+        'current_weather': {
+            'temperature': weather_data['main']['temp'],
+            'humidity': weather_data['main']['humidity'],
+            'cloudiness': weather_data['clouds']['all'],
+            'description': weather_data['weather'][0]['description']
+        },
+        'solar_adjustment': max(0.3, 1 - (weather_data['clouds']['all'] / 100))
+    }
+
+# Conditions change slowly: ~11 km buckets, 10 minute TTL, refreshed in the background
+weather_cache = WeatherCache(fetch_current_weather,
+                             ttl=int(os.environ.get('WEATHER_CACHE_TTL', 600)),
+                             bucket_deg=float(os.environ.get('WEATHER_CACHE_BUCKET_DEG', 0.1)))
+
 @app.route('/api/weather', methods=['POST'])
 def get_weather_data():
     data = request.get_json()
@@ -279,24 +894,11 @@ def get_weather_data():
     longitude = data.get('longitude')
     
     try:
-        # OpenWeatherMap free API (you'll need to get a free API key)
-        api_key = os.environ.get('OPENWEATHER_API_KEY', 'your_free_api_key_here')
-        url = f"http://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={api_key}&units=metric"
-        
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            weather_data = response.json()
-            return jsonify({
-                'current_weather': {
-                    'temperature': weather_data['main']['temp'],
-                    'humidity': weather_data['main']['humidity'],
-                    'cloudiness': weather_data['clouds']['all'],
-                    'description': weather_data['weather'][0]['description']
-                },
-                'solar_adjustment': max(0.3, 1 - (weather_data['clouds']['all'] / 100))
-            })
-    except Exception:
-        pass
+        weather = weather_cache.get(latitude, longitude)
+    except (TypeError, ValueError):
+        weather = None
+    if weather is not None:
+        return jsonify(weather)
     
     return jsonify({
         'current_weather': {
@@ -308,6 +910,57 @@ def get_weather_data():
         'solar_adjustment': 0.8
     })
 
+@app.route('/api/portfolio', methods=['POST'])
+def calculate_portfolio():
+    data = request.get_json() or {}
+    sites = data.get('sites')
+    if not isinstance(sites, list) or not sites:
+        return jsonify({'error': 'sites must be a non-empty list'}), 400
+    if len(sites) > PORTFOLIO_MAX_SITES:
+        job_id = job_queue.submit('portfolio', {'sites': sites})
+        return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+    
+    # Warm calls share the NASA POWER admission slots; more would be shed
+    warm_concurrency = nasa_breaker.max_concurrent
+    if not data.get('stream'):
+        return jsonify(evaluate_portfolio(sites, run_solar_calculation, warm=fetch_irradiance_summary,
+                                          warm_concurrency=warm_concurrency))
+    
+    # Newline-delimited JSON: one line per finished site with running totals,
+    # then a final line with the complete totals
+    def generate():
+        totals = None
+        for site_result, totals in iter_portfolio(sites, run_solar_calculation, warm=fetch_irradiance_summary,
+                                                  warm_concurrency=warm_concurrency):
+            yield json.dumps({'site': site_result, 'totals': totals.as_dict()}) + '\n'
+        if totals is not None:
+            yield json.dumps({'done': True, 'totals': totals.as_dict()}) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json() or {}
+    try:
+        job_id = job_queue.submit(data.get('type', 'calculate'), data.get('payload', {}))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 409
+    return jsonify({'job_id': job_id, 'status': 'cancelled'})
+
 # --- Serve the full HTML page (front-end) ---
 @app.route('/')
 def index():
@@ -382,6 +1035,12 @@ input[type=number] {
         <div class="input-panel">
             <h2 class="section-title">System Configuration</h2>
             
+            <div class="form-group">
+                <label>Location</label>
+                <input type="text" id="place" list="place-options" placeholder="Search city (e.g. Faisalabad)" autocomplete="off" oninput="searchPlaces()" onchange="selectPlace()">
+                <datalist id="place-options"></datalist>
+            </div>
+            
             <div class="form-group">
                 <label>Latitude</label>
                 <input type="number" id="latitude" placeholder="31.4504 (Faisalabad)" step="0.0001" value="31.4504">
@@ -396,6 +1055,12 @@ input[type=number] {
                 <label>Budget (USD)</label>
                 <input type="number" id="budget" placeholder="10000" min="0" value="10000">
             </div>
+            
+            <div class="form-group">
+                <label>Smart Meter Data (optional)</label>
+                <input type="file" id="meter-file" accept=".csv,text/csv" onchange="uploadMeterData()">
+                <div id="meter-info" style="font-size: 0.9rem; color: #4a5568; margin-top: 5px;"></div>
+            </div>
 
             <h3 style="margin: 20px 0 10px 0; color: #4a5568;">Appliances</h3>
             <div id="appliances-list"></div>
@@ -514,6 +1179,11 @@ input[type=number] {
     let charts = {};
     let calculationResults = null;
     
+    // Server-side session: after the first calculation only appliance edits are sent
+    const userSession = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Date.now().toString(16) + Math.random().toString(16).slice(2);
+    let sentAppliances = null;      // row id -> appliance as last sent
+    let serverApplianceIds = {};    // row id -> appliances.id on the server
+    
     function loadSampleData() {
         document.getElementById('appliances-list').innerHTML = '';
         applianceCount = 0;
@@ -567,8 +1237,8 @@ input[type=number] {
         }
     }
     
-    function getAppliancesData() {
-        const appliances = [];
+    function getApplianceRows() {
+        const rows = {};
         const applianceItems = document.querySelectorAll('.appliance-item');
         
         applianceItems.forEach(function(item) {
@@ -579,26 +1249,113 @@ input[type=number] {
             const quantity = parseInt(document.getElementById('quantity-' + id).value) || 1;
             
             if (name && wattage > 0 && hours > 0) {
-                appliances.push({
+                rows[id] = {
                     name: name,
                     wattage: wattage,
                     hours: hours,
                     quantity: quantity
+                };
+            }
+        });
+        
+        return rows;
+    }
+    
+    function getAppliancesData() {
+        return Object.values(getApplianceRows());
+    }
+    
+    function buildApplianceDelta(rows) {
+        const delta = {added: [], removed: [], changed: []};
+        Object.keys(rows).forEach(function(rowId) {
+            const serverId = serverApplianceIds[rowId];
+            if (serverId === undefined) {
+                delta.added.push(Object.assign({client_id: rowId}, rows[rowId]));
+            } else if (JSON.stringify(rows[rowId]) !== JSON.stringify(sentAppliances[rowId])) {
+                delta.changed.push(Object.assign({id: serverId}, rows[rowId]));
+            }
+        });
+        Object.keys(serverApplianceIds).forEach(function(rowId) {
+            if (!(rowId in rows)) delta.removed.push(serverApplianceIds[rowId]);
+        });
+        return delta;
+    }
+    
+    async function postCalculation(rows, location, onSection) {
+        if (sentAppliances !== null) {
+            const response = await fetch('/api/calculate/delta', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(Object.assign({user_session: userSession}, location, buildApplianceDelta(rows)))
+            });
+            if (response.ok) {
+                Object.keys(serverApplianceIds).forEach(function(rowId) {
+                    if (!(rowId in rows)) delete serverApplianceIds[rowId];
                 });
+                return response.json();
             }
+        }
+        
+        // First calculation (or the delta was rejected): send everything and
+        // render each section as the server streams it
+        serverApplianceIds = {};
+        return streamCalculation(Object.assign({
+            user_session: userSession,
+            appliances: Object.keys(rows).map(function(rowId) { return Object.assign({client_id: rowId}, rows[rowId]); })
+        }, location), onSection);
+    }
+    
+    // Reads the /api/calculate/stream server-sent events; onSection gets the
+    // partial result after every section
+    async function streamCalculation(body, onSection) {
+        const response = await fetch('/api/calculate/stream', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body)
         });
+        if (!response.ok || !response.body) throw new Error('Calculation failed');
         
-        return appliances;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const result = {};
+        let buffer = '';
+        while (true) {
+            const chunk = await reader.read();
+            if (chunk.done) break;
+            buffer += decoder.decode(chunk.value, {stream: true});
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let payload = '';
+                message.split('\n').forEach(function(line) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) payload += line.slice(6);
+                });
+                const data = JSON.parse(payload);
+                if (event === 'section') {
+                    result[data.name] = data.value;
+                    onSection(result);
+                } else if (event === 'done') {
+                    return Object.assign(result, data);
+                } else if (event === 'error') {
+                    throw new Error(data.error);
+                }
+            }
+        }
+        throw new Error('Calculation stream ended early');
     }
     
     async function calculateSystem() {
-        const appliances = getAppliancesData();
+        const rows = getApplianceRows();
+        const appliances = Object.values(rows);
         const latitude = parseFloat(document.getElementById('latitude').value);
         const longitude = parseFloat(document.getElementById('longitude').value);
         const budget = parseFloat(document.getElementById('budget').value) || 10000;
         
-        if (appliances.length === 0) {
-            alert('Please add at least one appliance');
+        if (appliances.length === 0 && !meterId) {
+            alert('Please add at least one appliance or upload smart meter data');
             return;
         }
         
@@ -611,23 +1368,20 @@ input[type=number] {
         document.getElementById('results').style.display = 'none';
         
         try {
-            const response = await fetch('/api/calculate', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    appliances: appliances,
-                    latitude: latitude,
-                    longitude: longitude,
-                    budget: budget
-                })
+            const rendered = {};
+            calculationResults = await postCalculation(rows, {
+                latitude: latitude,
+                longitude: longitude,
+                budget: budget,
+                meter_id: meterId
+            }, function(partial) {
+                document.getElementById('loading').style.display = 'none';
+                renderAvailable(partial, rendered);
             });
             
-            if (!response.ok) throw new Error('Calculation failed');
-            
-            calculationResults = await response.json();
-            displayResults(calculationResults);
+            Object.assign(serverApplianceIds, calculationResults.appliance_ids || {});
+            sentAppliances = rows;
+            renderAvailable(calculationResults, rendered);
             
         } catch (error) {
             console.error('Error:', error);
@@ -637,25 +1391,37 @@ input[type=number] {
         }
     }
     
-    function displayResults(data) {
-        document.getElementById('results').style.display = 'block';
-        
-        document.getElementById('panels-needed').textContent = data.panel_requirements.panels_needed;
-        document.getElementById('system-size').textContent = data.panel_requirements.recommended_system_size.toFixed(1) + 'kW';
-        document.getElementById('yearly-production').textContent = data.production_estimate.yearly_kwh;
-        document.getElementById('payback-period').textContent = data.cost_roi.payback_period_years;
-        
-        updateCharts(data);
-        updateDetailedInfo(data);
-    }
+    // Each view of the results and the sections it needs; views are drawn
+    // as soon as their sections have arrived
+    const resultViews = {
+        summary: {needs: ['panel_requirements'], render: function(data) {
+            document.getElementById('panels-needed').textContent = data.panel_requirements.panels_needed;
+            document.getElementById('system-size').textContent = data.panel_requirements.recommended_system_size.toFixed(1) + 'kW';
+        }},
+        payback: {needs: ['cost_roi'], render: function(data) {
+            document.getElementById('payback-period').textContent = data.cost_roi.payback_period_years;
+        }},
+        yearly: {needs: ['production_estimate'], render: function(data) {
+            document.getElementById('yearly-production').textContent = data.production_estimate.yearly_kwh;
+        }},
+        production: {needs: ['production_estimate', 'panel_requirements', 'tilt_angles'], render: updateProductionChart},
+        cost: {needs: ['cost_roi', 'battery_sizing', 'grid_region'], render: updateCostChart},
+        environmental: {needs: ['co2_savings', 'grid_region'], render: updateEnvironmentalChart},
+        grid: {needs: ['grid_analysis'], render: updateGridChart},
+        comparison: {needs: ['system_comparison'], render: updateComparisonChart},
+        degradation: {needs: ['degradation_forecast'], render: updateDegradationChart},
+        details: {needs: ['tilt_angles', 'maintenance_schedule'], render: updateDetailedInfo}
+    };
     
-    function updateCharts(data) {
-        updateProductionChart(data);
-        updateCostChart(data);
-        updateEnvironmentalChart(data);
-        updateGridChart(data);
-        updateComparisonChart(data);
-        updateDegradationChart(data);
+    // rendered: views already drawn for this result
+    function renderAvailable(data, rendered) {
+        document.getElementById('results').style.display = 'block';
+        Object.keys(resultViews).forEach(function(name) {
+            const view = resultViews[name];
+            if (rendered[name] || !view.needs.every(function(section) { return section in data; })) return;
+            view.render(data);
+            rendered[name] = true;
+        });
     }
     
     function updateProductionChart(data) {
@@ -761,7 +1527,8 @@ input[type=number] {
             <p><strong>Monthly Savings:</strong> ${data.cost_roi.monthly_savings}</p>
             <p><strong>Yearly Savings:</strong> ${data.cost_roi.yearly_savings}</p>
             <p><strong>Payback Period:</strong> ${data.cost_roi.payback_period_years} years</p>
-            <p><strong>Battery Capacity:</strong> ${data.battery_sizing.recommended_capacity_kwh} kWh</p>` +
+            <p><strong>Battery Capacity:</strong> ${data.battery_sizing.recommended_capacity_kwh} kWh</p>
+            <p><strong>Electricity Price:</strong> $${data.grid_region.electricity_rate}/kWh (${data.grid_region.name})</p>` +
             '</div>';
     }
     
@@ -779,6 +1546,7 @@ input[type=number] {
             '<div>Equivalent Trees Planted</div>' +
             '</div>' +
             '</div>' +
+            '<p><strong>Grid emission factor:</strong> ' + data.grid_region.co2_kg_per_kwh + ' kg CO₂/kWh (' + data.grid_region.name + ')</p>' +
             '</div>';
         
         const ctx = document.getElementById('environmentalChart').getContext('2d');
@@ -1051,6 +1819,72 @@ input[type=number] {
         if (event && event.target) event.target.classList.add('active');
     }
     
+    // Smart-meter upload: the stored load replaces the appliance totals
+    let meterId = null;
+    
+    async function uploadMeterData() {
+        const input = document.getElementById('meter-file');
+        const info = document.getElementById('meter-info');
+        meterId = null;
+        if (!input.files.length) {
+            info.textContent = '';
+            return;
+        }
+        
+        const form = new FormData();
+        form.append('file', input.files[0]);
+        form.append('user_session', userSession);
+        info.textContent = 'Reading meter data...';
+        try {
+            const response = await fetch('/api/meter', {method: 'POST', body: form});
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || 'Upload failed');
+            meterId = data.meter_id;
+            info.textContent = data.summary.avg_daily_kwh + ' kWh/day over ' + data.summary.days + ' days (' +
+                data.summary.start + ' to ' + data.summary.end + '), used instead of the appliance list';
+        } catch (error) {
+            info.textContent = error.message;
+            input.value = '';
+        }
+    }
+    
+    // Place autocomplete: suggestions from /api/geocode fill in the coordinates
+    let placeMatches = {};
+    let placeTimer = null;
+    
+    function searchPlaces() {
+        clearTimeout(placeTimer);
+        placeTimer = setTimeout(async function() {
+            const query = document.getElementById('place').value.trim();
+            if (!query || placeMatches[query]) return;
+            try {
+                const response = await fetch('/api/geocode?q=' + encodeURIComponent(query));
+                if (!response.ok) return;
+                const data = await response.json();
+                const options = document.getElementById('place-options');
+                options.innerHTML = '';
+                placeMatches = {};
+                data.places.forEach(place => {
+                    const label = place.name + ', ' + place.country;
+                    if (placeMatches[label]) return;
+                    placeMatches[label] = place;
+                    const option = document.createElement('option');
+                    option.value = label;
+                    options.appendChild(option);
+                });
+            } catch (error) {
+                console.error('Place search failed:', error);
+            }
+        }, 150);
+    }
+    
+    function selectPlace() {
+        const place = placeMatches[document.getElementById('place').value];
+        if (!place) return;
+        document.getElementById('latitude').value = place.latitude;
+        document.getElementById('longitude').value = place.longitude;
+    }
+    
     window.addEventListener('load', function() {
         loadSampleData();
     });
@@ -1060,6 +1894,53 @@ input[type=number] {
     '''
     return html_content
 
-if __name__ == '__main__':
+# --- App factory
+# Popular coordinates to warm before serving, e.g. "31.45,73.13;24.86,67.01"
+def parse_coordinates(value):
+    coordinates = []
+    for pair in (value or '').split(';'):
+        if not pair.strip():
+            continue
+        try:
+            lat, lon = (float(v) for v in pair.split(','))
+        except ValueError:
+            continue
+        coordinates.append((lat, lon))
+    return coordinates
+
+def warm_caches(coordinates):
+    # Runs in the gunicorn master under --preload, so every forked worker
+    # inherits the warmed caches copy-on-write.
+    def warm(coordinate):
+        lat, lon = coordinate
+        estimate_solar_production(lat, lon, 1)
+        weather_cache.get(lat, lon)
+    
+    # No more threads than the NASA breaker admits at once; extra calls would
+    # be shed to the fallback and leave their cells cold
+    with ThreadPoolExecutor(max_workers=nasa_breaker.max_concurrent) as pool:
+        list(pool.map(warm, coordinates))
+
+_app_initialized = False
+
+def create_app():
+    global _app_initialized
+    if _app_initialized:
+        return app
+    
+    # Schema once per process; with --preload that is once, before forking
     init_db()
+    place_index.available()  # map the place index so forked workers share it
+    
+    coordinates = parse_coordinates(os.environ.get('WARMUP_COORDINATES'))
+    if coordinates:
+        warm_caches(coordinates)
+    
+    _app_initialized = True
+    return app
+
+if __name__ == '__main__':
+    create_app()
+    job_queue.reset_interrupted()
+    job_queue.recover()
     app.run(host='0.0.0.0', port=7860, debug=True)
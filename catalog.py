@@ -0,0 +1,382 @@
+# catalog.py
+# Equipment catalog (panel and inverter datasheets) in SQLite with full-text
+# search on manufacturer/model and B-tree indexes on the numeric fields, plus
+# a stringing solver that checks panel/inverter compatibility across the
+# site's temperature extremes.
+#
+#   python catalog.py import panels my_panels.csv
+#   python catalog.py import inverters my_inverters.csv
+#
+# CSV columns match PANEL_COLUMNS / INVERTER_COLUMNS; data/ holds a small
+# generic seed set that is loaded into an empty catalog.
+import os
+import re
+import csv
+import sys
+import math
+import sqlite3
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PANEL_COLUMNS = ['manufacturer', 'model', 'wattage', 'voc', 'vmp', 'isc', 'imp', 'temp_coeff_voc',
+                 'temp_coeff_pmax', 'price']
+# May be left blank in imported CSVs
+OPTIONAL_PANEL_COLUMNS = {'temp_coeff_pmax'}
+INVERTER_COLUMNS = ['manufacturer', 'model', 'ac_power_kw', 'max_dc_voltage', 'mppt_min_voltage',
+                    'mppt_max_voltage', 'max_input_current', 'mppt_count', 'price']
+
+# Numeric range filters exposed to search: filter name -> column
+PANEL_RANGES = {'wattage': 'wattage', 'voc': 'voc', 'vmp': 'vmp', 'price': 'price'}
+INVERTER_RANGES = {'ac_power_kw': 'ac_power_kw', 'max_dc_voltage': 'max_dc_voltage', 'price': 'price'}
+
+# Cell temperature rise over ambient at full sun (NOCT-style approximation)
+CELL_TEMP_RISE = 25.0
+
+# Temperature coefficients in %/degC. Pmax = Vmp * Imp, so the Vmp
+# coefficient is the Pmax coefficient minus Imp's (small and positive).
+# Panels without a Pmax coefficient assume Vmp drifts 1.5x as fast as Voc,
+# the top of the usual 1.3-1.5x range, so the MPPT floor check errs safe.
+IMP_TEMP_COEFF = 0.05
+VMP_VOC_COEFF_RATIO = 1.5
+
+# Acceptable DC (array) to AC (inverter) power ratio
+DC_AC_MIN = 0.8
+DC_AC_MAX = 1.35
+
+# Inverter counts tried beyond the fewest that can carry the array
+EXTRA_INVERTER_COUNTS = 2
+
+SEARCH_LIMIT = 50
+
+
+def init_catalog(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS panels
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             manufacturer TEXT NOT NULL,
+             model TEXT NOT NULL,
+             wattage REAL NOT NULL,
+             voc REAL NOT NULL,
+             vmp REAL NOT NULL,
+             isc REAL NOT NULL,
+             imp REAL NOT NULL,
+             temp_coeff_voc REAL NOT NULL,
+             temp_coeff_pmax REAL,
+             price REAL NOT NULL,
+             price_per_watt REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_panels_wattage ON panels (wattage);
+        CREATE INDEX IF NOT EXISTS idx_panels_voc ON panels (voc);
+        CREATE INDEX IF NOT EXISTS idx_panels_vmp ON panels (vmp);
+        CREATE INDEX IF NOT EXISTS idx_panels_price ON panels (price);
+        CREATE INDEX IF NOT EXISTS idx_panels_price_per_watt ON panels (price_per_watt);
+
+        CREATE TABLE IF NOT EXISTS inverters
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             manufacturer TEXT NOT NULL,
+             model TEXT NOT NULL,
+             ac_power_kw REAL NOT NULL,
+             max_dc_voltage REAL NOT NULL,
+             mppt_min_voltage REAL NOT NULL,
+             mppt_max_voltage REAL NOT NULL,
+             max_input_current REAL NOT NULL,
+             mppt_count INTEGER NOT NULL,
+             price REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_inverters_ac_power ON inverters (ac_power_kw, price);
+        CREATE INDEX IF NOT EXISTS idx_inverters_max_dc_voltage ON inverters (max_dc_voltage);
+        CREATE INDEX IF NOT EXISTS idx_inverters_price ON inverters (price);
+
+        -- Full-text search over manufacturer/model, kept in sync by triggers
+        CREATE VIRTUAL TABLE IF NOT EXISTS panels_fts
+            USING fts5(manufacturer, model, content='panels', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS panels_ai AFTER INSERT ON panels BEGIN
+            INSERT INTO panels_fts (rowid, manufacturer, model) VALUES (new.id, new.manufacturer, new.model);
+        END;
+        CREATE TRIGGER IF NOT EXISTS panels_ad AFTER DELETE ON panels BEGIN
+            INSERT INTO panels_fts (panels_fts, rowid, manufacturer, model) VALUES ('delete', old.id, old.manufacturer, old.model);
+        END;
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS inverters_fts
+            USING fts5(manufacturer, model, content='inverters', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS inverters_ai AFTER INSERT ON inverters BEGIN
+            INSERT INTO inverters_fts (rowid, manufacturer, model) VALUES (new.id, new.manufacturer, new.model);
+        END;
+        CREATE TRIGGER IF NOT EXISTS inverters_ad AFTER DELETE ON inverters BEGIN
+            INSERT INTO inverters_fts (inverters_fts, rowid, manufacturer, model) VALUES ('delete', old.id, old.manufacturer, old.model);
+        END;
+    ''')
+
+    # Catalogs created before the Pmax coefficient was stored
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(panels)")}
+    if 'temp_coeff_pmax' not in columns:
+        conn.execute("ALTER TABLE panels ADD COLUMN temp_coeff_pmax REAL")
+
+    # Seed an empty catalog with the bundled generic models
+    for table, kind in (('panels', 'panels'), ('inverters', 'inverters')):
+        if conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0:
+            seed = os.path.join(HERE, 'data', f'{kind}.csv')
+            if os.path.exists(seed):
+                with open(seed, newline='') as f:
+                    import_rows(conn, kind, csv.DictReader(f))
+    conn.commit()
+    conn.close()
+
+
+def import_rows(conn, kind, rows):
+    # rows: iterable of dicts keyed by the CSV columns
+    if kind == 'panels':
+        values = []
+        for row in rows:
+            record = [row['manufacturer'], row['model']]
+            for column in PANEL_COLUMNS[2:]:
+                value = row.get(column)
+                blank = value is None or not value.strip()
+                record.append(None if blank and column in OPTIONAL_PANEL_COLUMNS else float(row[column]))
+            values.append(record + [float(row['price']) / float(row['wattage'])])  # price per watt
+        conn.executemany(f"INSERT INTO panels ({', '.join(PANEL_COLUMNS)}, price_per_watt) "
+                         f"VALUES ({', '.join('?' * (len(PANEL_COLUMNS) + 1))})", values)
+    else:
+        values = [[row['manufacturer'], row['model']] + [float(row[c]) for c in INVERTER_COLUMNS[2:-2]]
+                  + [int(row['mppt_count']), float(row['price'])] for row in rows]
+        conn.executemany(f"INSERT INTO inverters ({', '.join(INVERTER_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(INVERTER_COLUMNS))})", values)
+    return len(values)
+
+
+def fts_query(text):
+    # Free text -> FTS5 prefix query; user input never reaches FTS syntax
+    tokens = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(db_path, kind, text=None, ranges=None, order_by='price', limit=SEARCH_LIMIT):
+    # ranges: {'min_wattage': 300, 'max_price': 200, ...}
+    table = 'panels' if kind == 'panels' else 'inverters'
+    allowed = PANEL_RANGES if kind == 'panels' else INVERTER_RANGES
+    clauses, params = [], []
+
+    match = fts_query(text)
+    if match:
+        clauses.append(f"id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)")
+        params.append(match)
+
+    for name, value in (ranges or {}).items():
+        if value in (None, ''):
+            continue
+        bound, _, field = name.partition('_')
+        if bound not in ('min', 'max') or field not in allowed:
+            raise ValueError(f"unknown filter: {name}")
+        clauses.append(f"{allowed[field]} {'>=' if bound == 'min' else '<='} ?")
+        params.append(float(value))
+
+    sql = f"SELECT * FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {order_by} LIMIT ?"
+    params.append(int(limit))
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(row) for row in conn.execute(sql, params)]
+    conn.close()
+    return rows
+
+
+def get_item(db_path, kind, item_id):
+    table = 'panels' if kind == 'panels' else 'inverters'
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (item_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def site_temperatures(latitude, min_temp_c=None, max_temp_c=None):
+    # Rough climate default from latitude when the site's record lows/highs
+    # are not given
+    lat = abs(float(latitude))
+    t_min = float(min_temp_c) if min_temp_c is not None else 20 - 0.7 * lat
+    t_max = float(max_temp_c) if max_temp_c is not None else 42 - 0.25 * lat
+    return t_min, t_max
+
+
+def vmp_temp_coeff(panel):
+    # %/degC; see IMP_TEMP_COEFF / VMP_VOC_COEFF_RATIO
+    if panel.get('temp_coeff_pmax') is not None:
+        return panel['temp_coeff_pmax'] - IMP_TEMP_COEFF
+    return panel['temp_coeff_voc'] * VMP_VOC_COEFF_RATIO
+
+
+def string_limits(panel, inverter, t_min, t_max):
+    # Voltages move with cell temperature: cold mornings raise Voc (must stay
+    # under the inverter's max DC voltage and MPPT ceiling), hot afternoons
+    # lower Vmp (must stay above the MPPT floor).
+    voc_coeff = panel['temp_coeff_voc'] / 100
+    vmp_coeff = vmp_temp_coeff(panel) / 100
+    voc_cold = panel['voc'] * (1 + voc_coeff * (t_min - 25))
+    vmp_cold = panel['vmp'] * (1 + vmp_coeff * (t_min - 25))
+    vmp_hot = panel['vmp'] * (1 + vmp_coeff * (t_max + CELL_TEMP_RISE - 25))
+
+    max_series = math.floor(min(inverter['max_dc_voltage'] / voc_cold, inverter['mppt_max_voltage'] / vmp_cold))
+    min_series = max(1, math.ceil(inverter['mppt_min_voltage'] / vmp_hot))
+    max_parallel = math.floor(inverter['max_input_current'] / panel['isc'])  # per MPPT
+    return {
+        'min_modules_per_string': min_series,
+        'max_modules_per_string': max_series,
+        'max_strings_per_mppt': max_parallel,
+        'voc_cold': round(voc_cold, 2),
+        'vmp_cold': round(vmp_cold, 2),
+        'vmp_hot': round(vmp_hot, 2)
+    }
+
+
+def solve_stringing(panel, inverter, system_size_kw, t_min, t_max, dc_ac_range=(DC_AC_MIN, DC_AC_MAX)):
+    # Smallest valid array with at least the requested size: equal-length
+    # strings spread over the inverter's MPPTs. Returns None if incompatible.
+    # dc_ac_range=None accepts any DC/AC ratio (voltage limits still apply).
+    limits = string_limits(panel, inverter, t_min, t_max)
+    if limits['max_strings_per_mppt'] < 1 or limits['min_modules_per_string'] > limits['max_modules_per_string']:
+        return None
+
+    modules_needed = max(1, math.ceil(system_size_kw * 1000 / panel['wattage']))
+    max_strings = limits['max_strings_per_mppt'] * inverter['mppt_count']
+    best = None
+    for series in range(limits['min_modules_per_string'], limits['max_modules_per_string'] + 1):
+        strings = math.ceil(modules_needed / series)
+        if strings > max_strings:
+            continue
+        modules = series * strings
+        dc_kw = modules * panel['wattage'] / 1000
+        dc_ac_ratio = dc_kw / inverter['ac_power_kw']
+        if dc_ac_range is not None and not dc_ac_range[0] <= dc_ac_ratio <= dc_ac_range[1]:
+            continue
+        candidate = (modules, strings, series, dc_kw, dc_ac_ratio)
+        if best is None or candidate[:2] < best[:2]:
+            best = candidate
+
+    if best is None:
+        return None
+    modules, strings, series, dc_kw, dc_ac_ratio = best
+    return dict(limits,
+                modules=modules,
+                modules_per_string=series,
+                strings=strings,
+                strings_per_mppt=math.ceil(strings / inverter['mppt_count']),
+                string_voc_cold=round(series * limits['voc_cold'], 1),
+                string_vmp_hot=round(series * limits['vmp_hot'], 1),
+                dc_kw=round(dc_kw, 2),
+                dc_ac_ratio=round(dc_ac_ratio, 2))
+
+
+def inverter_options(db_path, system_size_kw, inverter_id=None, candidates=25):
+    # (inverter count, candidate inverters) pairs. Arrays too large for one
+    # inverter are split evenly over several identical ones, starting from
+    # the fewest that can carry the array.
+    if inverter_id is not None:
+        inverter = get_item(db_path, 'inverters', inverter_id)
+        if inverter is None:
+            return []
+        fewest = max(1, math.ceil(system_size_kw / (DC_AC_MAX * inverter['ac_power_kw'])))
+        return [(count, [inverter]) for count in range(fewest, fewest + EXTRA_INVERTER_COUNTS + 1)]
+
+    conn = sqlite3.connect(db_path)
+    largest = conn.execute("SELECT MAX(ac_power_kw) FROM inverters").fetchone()[0]
+    conn.close()
+    if not largest:
+        return []
+    fewest = max(1, math.ceil(system_size_kw / (DC_AC_MAX * largest)))
+    options = []
+    for count in range(fewest, fewest + EXTRA_INVERTER_COUNTS + 1):
+        share = system_size_kw / count
+        inverters = search(db_path, 'inverters', ranges={'min_ac_power_kw': share / DC_AC_MAX,
+                                                         'max_ac_power_kw': share / DC_AC_MIN},
+                           order_by='ac_power_kw, price', limit=candidates)
+        if inverters:
+            options.append((count, inverters))
+    return options
+
+
+def nearest_inverters(db_path, system_size_kw, candidates=25):
+    # For arrays no inverter fits within the DC/AC range (e.g. smaller than
+    # the smallest inverter): the nearest sizes on either side, one inverter
+    return [(1, search(db_path, 'inverters', ranges={'min_ac_power_kw': system_size_kw},
+                       order_by='ac_power_kw, price', limit=candidates)
+             + search(db_path, 'inverters', ranges={'max_ac_power_kw': system_size_kw},
+                      order_by='ac_power_kw DESC, price', limit=candidates))]
+
+
+def _best_pairing(panels, options, system_size_kw, t_min, t_max, dc_ac_range):
+    # Cheapest compatible combination; with dc_ac_range=None the one whose
+    # DC/AC ratio is closest to 1, then the cheapest
+    best, best_key = None, None
+    for count, inverters in options:
+        for panel in panels:
+            for inverter in inverters:
+                stringing = solve_stringing(panel, inverter, system_size_kw / count, t_min, t_max, dc_ac_range)
+                if stringing is None:
+                    continue
+                cost = count * (stringing['modules'] * panel['price'] + inverter['price'])
+                key = (cost,) if dc_ac_range else (abs(math.log(stringing['dc_ac_ratio'])), cost)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = {'panel': panel, 'inverter': inverter, 'inverter_count': count,
+                            'stringing': stringing, 'equipment_cost': round(cost, 2)}
+    return best
+
+
+def select_equipment(db_path, system_size_kw, t_min, t_max, panel_id=None, inverter_id=None, candidates=25):
+    # Cheapest compatible panel/inverter combination, using as many identical
+    # inverters as the array needs; stringing is per inverter. Candidates come
+    # from indexed queries (best price per watt, inverters sized for their
+    # share of the array), so the cost is independent of the catalog size.
+    # When nothing fits the DC/AC range, the closest match is returned with
+    # a warning instead.
+    if panel_id is not None:
+        panel = get_item(db_path, 'panels', panel_id)
+        panels = [panel] if panel else []
+    else:
+        panels = search(db_path, 'panels', order_by='price_per_watt', limit=candidates)
+
+    options = inverter_options(db_path, system_size_kw, inverter_id, candidates)
+    best = _best_pairing(panels, options, system_size_kw, t_min, t_max, (DC_AC_MIN, DC_AC_MAX))
+    warnings = []
+    if best is None:
+        if not options and inverter_id is None:
+            options = nearest_inverters(db_path, system_size_kw, candidates)
+        best = _best_pairing(panels, options, system_size_kw, t_min, t_max, None)
+        if best is None:
+            return None
+        ratio = best['stringing']['dc_ac_ratio']
+        sizing = 'oversized' if ratio < DC_AC_MIN else 'undersized'
+        warnings.append(f"DC/AC ratio {ratio} is outside {DC_AC_MIN}-{DC_AC_MAX}: the inverter is {sizing} "
+                        f"for this array" + ("" if inverter_id is not None else "; no better match in the catalog"))
+
+    count, stringing = best['inverter_count'], best['stringing']
+    best['modules'] = count * stringing['modules']
+    best['dc_kw'] = round(count * stringing['modules'] * best['panel']['wattage'] / 1000, 2)
+    best['warnings'] = warnings
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the equipment catalog.')
+    parser.add_argument('--db', default=os.environ.get('SOLAR_DB_PATH', 'solar_data.db'))
+    sub = parser.add_subparsers(dest='command', required=True)
+    importer = sub.add_parser('import', help='import datasheets from CSV')
+    importer.add_argument('kind', choices=['panels', 'inverters'])
+    importer.add_argument('csv_file')
+    args = parser.parse_args(argv)
+
+    init_catalog(args.db)
+    conn = sqlite3.connect(args.db)
+    with open(args.csv_file, newline='') as f:
+        count = import_rows(conn, args.kind, csv.DictReader(f))
+    conn.commit()
+    conn.close()
+    print(f"imported {count} {args.kind}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# circuit_breaker.py
+# Circuit breaker with admission control for slow or flaky upstreams.
+# While the upstream fails too often the breaker opens and calls fail fast
+# instead of tying up a worker for the full timeout; after a cool-down a
+# limited number of trial calls (half-open) decide whether to close again.
+# Independently, at most max_concurrent calls may wait on the upstream at once.
+# Only exceptions accepted by is_failure count against the upstream; others
+# (bad requests, unusable payloads) pass through without being recorded.
+import time
+import threading
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class LoadShedError(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=0.5, window=20, min_calls=5, reset_timeout=30,
+                 half_open_calls=1, max_concurrent=4, acquire_timeout=0.0, is_failure=None):
+        self.name = name
+        self.is_failure = is_failure or (lambda exc: True)
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.acquire_timeout = acquire_timeout
+        self.max_concurrent = max_concurrent
+        self._outcomes = deque(maxlen=window)  # True = failure
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def _admit(self):
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                raise CircuitOpenError(f"{self.name}: circuit open")
+            if state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    raise CircuitOpenError(f"{self.name}: circuit half-open, trial in progress")
+                self._trials += 1
+
+    def _record(self, failed):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_threshold:
+                self._trip()
+
+    def _release_trial(self):
+        # A half-open trial that said nothing about the upstream's health
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trials -= 1
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._outcomes.clear()
+
+    def call(self, func, *args, **kwargs):
+        self._admit()
+
+        # Admission control: shed load instead of queueing behind a slow upstream
+        if self.acquire_timeout:
+            admitted = self._slots.acquire(timeout=self.acquire_timeout)
+        else:
+            admitted = self._slots.acquire(blocking=False)
+        if not admitted:
+            self._release_trial()
+            raise LoadShedError(f"{self.name}: too many concurrent calls")
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._record(True)
+            else:
+                self._release_trial()
+            raise
+        finally:
+            self._slots.release()
+        self._record(False)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            return {
+                'name': self.name,
+                'state': state,
+                'recent_calls': calls,
+                'failure_rate': round(sum(self._outcomes) / calls, 2) if calls else 0.0
+            }
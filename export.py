@@ -0,0 +1,194 @@
+# export.py
+# Streaming export of the solar_calculations history as CSV, or as Parquet
+# when pyarrow is installed. Rows are read in fixed-size batches from a lazy
+# SQLite cursor and encoded batch by batch, so memory stays flat no matter
+# how many rows match.
+#
+#   python export.py --format csv --out history.csv --start 2026-01-01
+import io
+import os
+import csv
+import sys
+import time
+import sqlite3
+import argparse
+import importlib.util
+
+EXPORT_COLUMNS = ['id', 'user_session', 'latitude', 'longitude', 'total_daily_consumption', 'panels_needed',
+                  'battery_capacity', 'system_cost', 'payback_period', 'co2_savings', 'calculation_date']
+
+BATCH_SIZE = 5000
+
+FILTERS = {
+    'start': "calculation_date >= ?",
+    'end': "calculation_date < ?",
+    'session': "user_session = ?",
+    'min_lat': "latitude >= ?",
+    'max_lat': "latitude <= ?",
+    'min_lon': "longitude >= ?",
+    'max_lon': "longitude <= ?"
+}
+
+
+def parquet_available():
+    # Checked without importing: pyarrow is only loaded for a Parquet export
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def build_query(filters):
+    # filters: dict of FILTERS keys; dates are 'YYYY-MM-DD[ HH:MM:SS]', the
+    # region is a latitude/longitude bounding box
+    clauses, params = [], []
+    for name, clause in FILTERS.items():
+        value = filters.get(name)
+        if value in (None, ''):
+            continue
+        if name.startswith(('min_', 'max_')):
+            value = float(value)
+        clauses.append(clause)
+        params.append(value)
+
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM solar_calculations"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql + " ORDER BY id", params
+
+
+def iter_batches(db_path, filters, batch_size=BATCH_SIZE):
+    conn = sqlite3.connect(db_path)
+    try:
+        sql, params = build_query(filters)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def iter_csv(batches, stats=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        if stats is not None:
+            stats['rows'] += len(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file object the Parquet writer flushes into; the bytes are
+    # drained after every row group.
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()), ('user_session', pa.string()), ('latitude', pa.float64()),
+        ('longitude', pa.float64()), ('total_daily_consumption', pa.float64()), ('panels_needed', pa.int64()),
+        ('battery_capacity', pa.float64()), ('system_cost', pa.float64()), ('payback_period', pa.float64()),
+        ('co2_savings', pa.float64()), ('calculation_date', pa.string())
+    ])
+
+
+def iter_parquet(batches, stats=None):
+    # One Parquet row group per batch
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                          for column, field in zip(columns, schema)], schema=schema)
+            writer.write_table(table)
+            if stats is not None:
+                stats['rows'] += len(rows)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export(db_path, filters, fmt='csv', batch_size=BATCH_SIZE, stats=None):
+    # Generator of encoded chunks; stats (if given) gets 'rows' and 'bytes'
+    # and is complete once the generator is exhausted.
+    if stats is None:
+        stats = {}
+    stats.update(rows=0, bytes=0, started=time.time())
+    encode = iter_parquet if fmt == 'parquet' else iter_csv
+    for chunk in encode(iter_batches(db_path, filters, batch_size), stats):
+        stats['bytes'] += len(chunk)
+        yield chunk
+    stats['seconds'] = time.time() - stats['started']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export calculation history.')
+    parser.add_argument('--db', default=os.environ.get('SOLAR_DB_PATH', 'solar_data.db'))
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--out', help='output file (default: stdout for CSV)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    for name in FILTERS:
+        parser.add_argument('--' + name.replace('_', '-'), dest=name)
+    args = parser.parse_args(argv)
+
+    if args.format == 'parquet' and not parquet_available():
+        parser.error('parquet export requires pyarrow')
+    if args.format == 'parquet' and not args.out:
+        parser.error('--out is required for parquet')
+
+    filters = {name: getattr(args, name) for name in FILTERS}
+    stats = {}
+    out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+    try:
+        for chunk in export(args.db, filters, args.format, args.batch_size, stats):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+    seconds = max(stats['seconds'], 1e-9)
+    print(f"exported {stats['rows']} rows ({stats['bytes']} bytes) in {seconds:.2f}s "
+          f"({stats['rows'] / seconds:.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# gazetteer.py
+# Offline place-name lookup for the location autocomplete. A GeoNames-style
+# dump is compiled once into a flat binary index: a sorted array of
+# fixed-size records pointing into a string blob, plus a table of the most
+# populous places for every short prefix (one or two letters match too many
+# names to rank at query time). Lookups binary-search straight out of an
+# mmap, so nothing is parsed at startup and every gunicorn worker shares the
+# same page-cache pages.
+#
+#   python gazetteer.py build cities15000.txt gazetteer.idx
+#   python gazetteer.py search gazetteer.idx faisal
+#
+# Input is the GeoNames tab-separated format (geonameid, name, asciiname,
+# alternatenames, latitude, longitude, ..., country code, ..., population);
+# data/cities.tsv is a small bundled seed in the same format.
+import os
+import re
+import sys
+import mmap
+import struct
+import argparse
+import threading
+import unicodedata
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SEED_PATH = os.path.join(HERE, 'data', 'cities.tsv')
+
+MAGIC = b'GZT2'
+# magic, record count, prefix count, prefix table offset, blob offset
+HEADER = struct.Struct('<4sIIII')
+# key offset, name offset, key length, name length, lat, lon, population, country
+RECORD = struct.Struct('<IIHHffI2s')
+
+# Prefixes up to SHORT_PREFIX characters are answered from the precomputed
+# table, which keeps the TOP_N most populous places for each
+SHORT_PREFIX = 3
+TOP_N = 20
+PREFIX_BYTES = 4 * SHORT_PREFIX
+PREFIX = struct.Struct(f'<{PREFIX_BYTES}s{TOP_N}I')
+NO_RECORD = 0xFFFFFFFF
+
+# Upper bound on prefix matches ranked per longer query
+MAX_SCAN = 2000
+
+# GeoNames column positions
+COL_NAME, COL_ASCIINAME, COL_LAT, COL_LON, COL_COUNTRY, COL_POPULATION = 1, 2, 4, 5, 8, 14
+
+
+def normalize(text):
+    # Case- and accent-insensitive key: "São Paulo" -> "sao paulo"
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def read_geonames(path):
+    # (name, asciiname, latitude, longitude, country, population) per place
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            cols = line.rstrip('\n').split('\t')
+            try:
+                yield (cols[COL_NAME], cols[COL_ASCIINAME], float(cols[COL_LAT]), float(cols[COL_LON]),
+                       cols[COL_COUNTRY], int(cols[COL_POPULATION] or 0))
+            except (IndexError, ValueError):
+                continue
+
+
+def build_index(source_path, index_path):
+    # Each place is keyed by its name and, when different, its ASCII name
+    blob = bytearray()
+    strings = {}
+
+    def intern(text):
+        data = text.encode('utf-8')[:0xFFFF]
+        if data not in strings:
+            strings[data] = len(blob)
+            blob.extend(data)
+        return strings[data], len(data)
+
+    entries = []
+    for name, asciiname, lat, lon, country, population in read_geonames(source_path):
+        name_ref = intern(name)
+        for key in {normalize(name), normalize(asciiname)}:
+            if key:
+                entries.append((key.encode('utf-8'), -population, name_ref, lat, lon, country, population))
+    entries.sort(key=lambda e: (e[0], e[1]))
+
+    records = bytearray()
+    for key, _, (name_off, name_len), lat, lon, country, population in entries:
+        key_off, key_len = intern(key.decode('utf-8'))
+        records.extend(RECORD.pack(key_off, name_off, key_len, name_len, lat, lon,
+                                   min(population, 0xFFFFFFFF), country.encode('ascii', 'replace')[:2]))
+
+    # Short-prefix table: record indices of the most populous distinct places
+    top = {}
+    for i, (key, _, name_ref, lat, lon, _, population) in enumerate(entries):
+        text = key.decode('utf-8')
+        for length in range(1, min(len(text), SHORT_PREFIX) + 1):
+            top.setdefault(text[:length].encode('utf-8'), {}).setdefault((name_ref, lat, lon), (population, i))
+    prefixes = bytearray()
+    for prefix in sorted(top):
+        best = sorted(top[prefix].values(), key=lambda item: -item[0])[:TOP_N]
+        indices = [i for _, i in best] + [NO_RECORD] * (TOP_N - len(best))
+        prefixes.extend(PREFIX.pack(prefix, *indices))
+
+    # Write to a temp file and rename so running workers never see a partial index
+    prefix_offset = HEADER.size + len(records)
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries), len(top), prefix_offset, prefix_offset + len(prefixes)))
+        f.write(records)
+        f.write(prefixes)
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+    return len(entries)
+
+
+def ensure_index(index_path, source_path=SEED_PATH):
+    # (Re)build when the index is missing or older than its source
+    if not os.path.exists(source_path):
+        return False
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(source_path):
+        build_index(source_path, index_path)
+    return True
+
+
+class Gazetteer:
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # Mapped lazily, once per process; under --preload the master maps it
+        # and forked workers inherit the mapping
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    with open(self.index_path, 'rb') as f:
+                        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, self._count, self._prefix_count, self._prefixes, self._blob = HEADER.unpack_from(data, 0)
+                    if magic != MAGIC:
+                        raise ValueError(f"{self.index_path} is not a gazetteer index")
+                    self._map = data
+        return self._map
+
+    def available(self):
+        try:
+            self._open()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+
+    def _key(self, record):
+        start = self._blob + record[0]
+        return self._map[start:start + record[2]]
+
+    def _lower_bound(self, prefix):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(self._record(mid)) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _short_prefix(self, prefix):
+        # Precomputed record indices for a short prefix
+        padded = prefix.ljust(PREFIX_BYTES, b'\x00')
+        lo, hi = 0, self._prefix_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = PREFIX.unpack_from(self._map, self._prefixes + mid * PREFIX.size)
+            if entry[0] < padded:
+                lo = mid + 1
+            elif entry[0] > padded:
+                hi = mid
+            else:
+                return [i for i in entry[1:] if i != NO_RECORD]
+        return []
+
+    def search(self, text, limit=10):
+        # Places whose name starts with text, most populous first
+        self._open()
+        normalized = normalize(text)
+        prefix = normalized.encode('utf-8')
+        if not prefix:
+            return []
+        if len(normalized) <= SHORT_PREFIX:
+            return [self._place(self._record(i)) for i in self._short_prefix(prefix)[:limit]]
+
+        matches = []
+        seen = set()
+        i = self._lower_bound(prefix)
+        while i < self._count and len(matches) < MAX_SCAN:
+            record = self._record(i)
+            if not self._key(record).startswith(prefix):
+                break
+            place = (record[1], record[4], record[5])  # name + position: same place under two keys
+            if place not in seen:
+                seen.add(place)
+                matches.append(record)
+            i += 1
+
+        matches.sort(key=lambda r: -r[6])
+        return [self._place(record) for record in matches[:limit]]
+
+    def _place(self, record):
+        key_off, name_off, key_len, name_len, lat, lon, population, country = record
+        start = self._blob + name_off
+        return {
+            'name': self._map[start:start + name_len].decode('utf-8'),
+            'country': country.decode('ascii').strip('\x00'),
+            'latitude': round(lat, 4),
+            'longitude': round(lon, 4),
+            'population': population
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or query the offline gazetteer index.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build')
+    build.add_argument('source', help='GeoNames dump (e.g. cities15000.txt)')
+    build.add_argument('index')
+    query = sub.add_parser('search')
+    query.add_argument('index')
+    query.add_argument('text')
+    query.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_index(args.source, args.index)
+        print(f"indexed {count} names into {args.index} ({os.path.getsize(args.index)} bytes)", file=sys.stderr)
+    else:
+        for place in Gazetteer(args.index).search(args.text, args.limit):
+            print(f"{place['name']}, {place['country']}\t{place['latitude']}\t{place['longitude']}\t{place['population']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
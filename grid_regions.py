@@ -0,0 +1,125 @@
+# grid_regions.py
+# Regional grid emission factors and electricity prices. Regions are
+# polygons (GeoJSON) with co2_kg_per_kwh and electricity_price_usd_per_kwh
+# properties; a point resolves to the smallest region containing it, so a
+# sub-national region (e.g. a hydro-heavy province) overrides its country.
+#
+# Polygons are bucketed into a coarse lat/lon grid by bounding box, so a
+# lookup only ray-casts the handful of polygons whose box covers the point's
+# cell. Results are cached per fine coordinate bucket.
+#
+# data/grid_regions.json is a coarse bundled dataset; point GRID_REGIONS_PATH
+# at a detailed boundary file with the same properties for exact borders.
+import os
+import json
+import math
+from functools import lru_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REGIONS_PATH = os.environ.get('GRID_REGIONS_PATH', os.path.join(HERE, 'data', 'grid_regions.json'))
+
+# Used where no region matches (open ocean, uncovered countries)
+DEFAULT_CO2_FACTOR = 0.5  # Average global factor, kg CO2 per kWh
+DEFAULT_ELECTRICITY_RATE = 0.12  # USD per kWh
+
+# Index cell size; each cell lists the polygons whose bounding box overlaps it
+INDEX_CELL_DEG = 1.0
+
+# Lookup cache resolution, about 1 km
+LOOKUP_BUCKET_DEG = 0.01
+
+
+def point_in_ring(lon, lat, ring):
+    # Even-odd ray casting; ring is a list of [lon, lat]
+    inside = False
+    x1, y1 = ring[-1][0], ring[-1][1]
+    for point in ring:
+        x2, y2 = point[0], point[1]
+        if (y2 > lat) != (y1 > lat) and lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def ring_area(ring):
+    # Planar shoelace area in square degrees; only used to rank overlaps
+    area = 0.0
+    for i in range(len(ring)):
+        x1, y1 = ring[i - 1][0], ring[i - 1][1]
+        x2, y2 = ring[i][0], ring[i][1]
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2
+
+
+class RegionIndex:
+    def __init__(self, features, cell_deg=INDEX_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.regions = []  # (properties, polygons, bbox, area); polygon = [outer, *holes]
+        self.cells = {}
+
+        for feature in features:
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            outers = [point for polygon in polygons for point in polygon[0]]
+            bbox = (min(p[0] for p in outers), min(p[1] for p in outers),
+                    max(p[0] for p in outers), max(p[1] for p in outers))
+            area = sum(ring_area(polygon[0]) - sum(ring_area(hole) for hole in polygon[1:]) for polygon in polygons)
+            self.regions.append((feature.get('properties') or {}, polygons, bbox, area))
+
+        # Smallest first, so the first hit is the most specific region
+        self.regions.sort(key=lambda region: region[3])
+        for index, (_, _, (min_lon, min_lat, max_lon, max_lat), _) in enumerate(self.regions):
+            for cell_lat in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for cell_lon in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                    self.cells.setdefault((cell_lat, cell_lon), []).append(index)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_deg))
+
+    def lookup(self, latitude, longitude):
+        # Properties of the smallest region containing the point, or None
+        for index in self.cells.get((self._cell(latitude), self._cell(longitude)), ()):
+            properties, polygons, (min_lon, min_lat, max_lon, max_lat), _ = self.regions[index]
+            if not (min_lon <= longitude <= max_lon and min_lat <= latitude <= max_lat):
+                continue
+            for polygon in polygons:
+                if point_in_ring(longitude, latitude, polygon[0]) and \
+                        not any(point_in_ring(longitude, latitude, hole) for hole in polygon[1:]):
+                    return properties
+        return None
+
+
+@lru_cache(maxsize=1)
+def load_index(path=REGIONS_PATH):
+    try:
+        with open(path) as f:
+            features = json.load(f).get('features', [])
+    except (OSError, ValueError):
+        features = []
+    return RegionIndex(features)
+
+
+@lru_cache(maxsize=100000)
+def _region_for_bucket(bucket_lat, bucket_lon):
+    properties = load_index().lookup(bucket_lat * LOOKUP_BUCKET_DEG, bucket_lon * LOOKUP_BUCKET_DEG)
+    if properties is None:
+        return {'id': None, 'name': 'Global average', 'co2_kg_per_kwh': DEFAULT_CO2_FACTOR,
+                'electricity_rate': DEFAULT_ELECTRICITY_RATE}
+    return {
+        'id': properties.get('id'),
+        'name': properties.get('name'),
+        'co2_kg_per_kwh': float(properties.get('co2_kg_per_kwh', DEFAULT_CO2_FACTOR)),
+        'electricity_rate': float(properties.get('electricity_price_usd_per_kwh', DEFAULT_ELECTRICITY_RATE))
+    }
+
+
+def grid_region(latitude, longitude):
+    # Emission factor and electricity price for a coordinate. The returned
+    # dict is shared by the cache; copy it before changing it.
+    return _region_for_bucket(int(round(float(latitude) / LOOKUP_BUCKET_DEG)),
+                              int(round(float(longitude) / LOOKUP_BUCKET_DEG)))
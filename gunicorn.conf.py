@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn main:app` (see Procfile).
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Load the app (schema, deferred imports, cache warmup) once in the master and
+# fork workers from it, so they start instantly and share memory copy-on-write.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    # Runs once in the master before any worker exists: jobs still marked
+    # running belong to a previous deployment.
+    from app import init_db, job_queue
+    init_db()
+    job_queue.reset_interrupted()
+
+
+def post_fork(server, worker):
+    # Process pools must not be shared across a fork, so each worker picks up
+    # left-over queued jobs itself.
+    from app import job_queue
+    job_queue.recover()
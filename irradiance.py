@@ -0,0 +1,284 @@
+# irradiance.py
+# NASA POWER irradiance fetches and the local store that lets live requests
+# (and the prefetch CLI) reuse them instead of calling the upstream again.
+# Multi-year daily series are reduced to a compact summary (monthly means,
+# P50/P90 and inter-annual variance); only the summary is stored.
+import os
+import math
+import json
+import time
+import random
+import sqlite3
+import statistics
+from datetime import datetime
+
+NASA_POWER_URL = os.environ.get('NASA_POWER_URL', "https://power.larc.nasa.gov/api/temporal/daily/point")
+
+# Years fetched for the long-term statistics
+START_YEAR = int(os.environ.get('IRRADIANCE_START_YEAR', 2014))
+END_YEAR = int(os.environ.get('IRRADIANCE_END_YEAR', 2023))
+
+# NASA POWER solar data is gridded at roughly 0.5 degrees, so points in the
+# same cell share one stored value. The app, the portfolio planner and the
+# prefetch CLI all bucket with this value, so set it through the environment
+# for all of them at once.
+GRID_DEG = float(os.environ.get('IRRADIANCE_GRID_DEG', 0.5))
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.2
+
+# One-sided z-score for the value exceeded in 90% of years
+Z_P90 = 1.2816
+
+# A year needs this many valid days to count towards P50/P90
+MIN_DAYS_PER_YEAR = 300
+
+
+def grid_bucket(latitude, longitude, grid_deg=GRID_DEG):
+    return (int(round(float(latitude) / grid_deg)), int(round(float(longitude) / grid_deg)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def summarize_daily_series(items):
+    # One pass over (YYYYMMDD, value) pairs. NASA marks missing days with
+    # -999, which are skipped instead of dragging the mean down.
+    month_count = [0] * 12
+    month_sum = [0.0] * 12
+    year_count = {}
+    year_sum = {}
+    for day, value in items:
+        if value is None or value < 0:
+            continue
+        month = int(day[4:6]) - 1
+        year = day[:4]
+        month_count[month] += 1
+        month_sum[month] += value
+        year_count[year] = year_count.get(year, 0) + 1
+        year_sum[year] = year_sum.get(year, 0.0) + value
+
+    total = sum(month_count)
+    if not total:
+        raise ValueError("no valid irradiance values")
+
+    annual = [year_sum[y] / year_count[y] for y in sorted(year_sum) if year_count[y] >= MIN_DAYS_PER_YEAR]
+    avg_irradiance = sum(month_sum) / total
+    p50 = statistics.median(annual) if annual else avg_irradiance
+    variance = statistics.variance(annual) if len(annual) >= 2 else 0.0
+
+    return {
+        'avg_irradiance': avg_irradiance,
+        'monthly_mean': [round(month_sum[m] / month_count[m], 3) if month_count[m] else None for m in range(12)],
+        'p50': p50,
+        'p90': max(0.0, p50 - Z_P90 * math.sqrt(variance)),
+        'variance': variance,
+        'years': len(annual)
+    }
+
+
+def default_summary(avg_irradiance):
+    # Summary for a bare average (fallbacks, rows stored before summaries)
+    return {'avg_irradiance': avg_irradiance, 'monthly_mean': None, 'p50': None, 'p90': None,
+            'variance': None, 'years': 0}
+
+
+def blend_summaries(weighted):
+    # Weighted average of (weight, summary) pairs, field by field
+    total = sum(weight for weight, _ in weighted)
+    blended = default_summary(sum(weight * s['avg_irradiance'] for weight, s in weighted) / total)
+
+    for field in ('p50', 'p90', 'variance'):
+        known = [(weight, s[field]) for weight, s in weighted if s[field] is not None]
+        if known:
+            blended[field] = sum(w * v for w, v in known) / sum(w for w, _ in known)
+
+    months = []
+    for m in range(12):
+        known = [(weight, s['monthly_mean'][m]) for weight, s in weighted
+                 if s['monthly_mean'] and s['monthly_mean'][m] is not None]
+        months.append(round(sum(w * v for w, v in known) / sum(w for w, _ in known), 3) if known else None)
+    if any(value is not None for value in months):
+        blended['monthly_mean'] = months
+    blended['years'] = min(s['years'] for _, s in weighted)
+    return blended
+
+
+def fetch_nasa_irradiance(latitude, longitude, session=None, timeout=10):
+    # Long-term ALLSKY_SFC_SW_DWN summary for one point. Raises on any failure.
+    import requests  # deferred: only paid by processes that hit the network
+
+    params = {
+        'parameters': 'ALLSKY_SFC_SW_DWN',
+        'community': 'RE',
+        'longitude': longitude,
+        'latitude': latitude,
+        'start': f'{START_YEAR}0101',
+        'end': f'{END_YEAR}1231',
+        'format': 'JSON'
+    }
+
+    response = (session or requests).get(NASA_POWER_URL, params=params, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    return summarize_daily_series(data['properties']['parameter']['ALLSKY_SFC_SW_DWN'].items())
+
+
+def fetch_with_retries(latitude, longitude, session=None, retries=3, backoff=1.0, timeout=10):
+    # Exponential backoff with jitter between attempts
+    for attempt in range(retries + 1):
+        try:
+            return fetch_nasa_irradiance(latitude, longitude, session=session, timeout=timeout)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+SUMMARY_COLUMNS = "avg_irradiance, monthly_mean, p50, p90, variance, years"
+
+
+def _row_to_summary(row):
+    avg_irradiance, monthly_mean, p50, p90, variance, years = row
+    return {
+        'avg_irradiance': avg_irradiance,
+        'monthly_mean': json.loads(monthly_mean) if monthly_mean else None,
+        'p50': p50,
+        'p90': p90,
+        'variance': variance,
+        'years': years or 0
+    }
+
+
+class IrradianceStore:
+    def __init__(self, db_path, grid_deg=GRID_DEG):
+        self.db_path = db_path
+        self.grid_deg = grid_deg
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS irradiance
+                        (bucket_lat INTEGER NOT NULL,
+                         bucket_lon INTEGER NOT NULL,
+                         latitude REAL,
+                         longitude REAL,
+                         avg_irradiance REAL NOT NULL,
+                         fetched_at TEXT,
+                         monthly_mean TEXT,
+                         p50 REAL,
+                         p90 REAL,
+                         variance REAL,
+                         years INTEGER,
+                         PRIMARY KEY (bucket_lat, bucket_lon))''')
+
+        # Stores created before the multi-year summaries only had the mean
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(irradiance)")}
+        for column, kind in (('monthly_mean', 'TEXT'), ('p50', 'REAL'), ('p90', 'REAL'),
+                             ('variance', 'REAL'), ('years', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE irradiance ADD COLUMN {column} {kind}")
+        conn.commit()
+        conn.close()
+
+    def get(self, latitude, longitude):
+        bucket_lat, bucket_lon = grid_bucket(latitude, longitude, self.grid_deg)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(f"SELECT {SUMMARY_COLUMNS} FROM irradiance WHERE bucket_lat = ? AND bucket_lon = ?",
+                               (bucket_lat, bucket_lon)).fetchone()
+        except sqlite3.OperationalError:
+            row = None  # store not initialised yet
+        conn.close()
+        return _row_to_summary(row) if row else None
+
+    def neighbors(self, latitude, longitude, max_distance_km):
+        # Stored points within max_distance_km as (distance_km, summary).
+        # The (bucket_lat, bucket_lon) primary key is the spatial index: each
+        # bucket row in range is one B-tree range seek, so the cost is
+        # O(rows * log n) regardless of how many points are stored, and new
+        # points are indexed as they are inserted.
+        latitude, longitude = float(latitude), float(longitude)
+        bucket_lat, bucket_lon = grid_bucket(latitude, longitude, self.grid_deg)
+        lat_span = int(math.ceil(max_distance_km / KM_PER_DEG_LAT / self.grid_deg))
+        lon_buckets = int(round(360 / self.grid_deg))
+        half_lon = lon_buckets // 2
+
+        conn = sqlite3.connect(self.db_path)
+        found = []
+        try:
+            for row_lat in range(bucket_lat - lat_span, bucket_lat + lat_span + 1):
+                row_deg = min(abs(row_lat) * self.grid_deg, 89.9)
+                km_per_deg_lon = KM_PER_DEG_LAT * math.cos(math.radians(row_deg))
+                lon_span = min(half_lon, int(math.ceil(max_distance_km / max(km_per_deg_lon, 1e-6) / self.grid_deg)))
+
+                # Split the longitude range where it crosses the antimeridian
+                lo, hi = bucket_lon - lon_span, bucket_lon + lon_span
+                ranges = [(lo, hi)]
+                if lo < -half_lon:
+                    ranges = [(-half_lon, hi), (lo + lon_buckets, half_lon)]
+                elif hi > half_lon:
+                    ranges = [(lo, half_lon), (-half_lon, hi - lon_buckets)]
+
+                for range_lo, range_hi in ranges:
+                    rows = conn.execute(
+                        f"SELECT latitude, longitude, {SUMMARY_COLUMNS} FROM irradiance "
+                        "WHERE bucket_lat = ? AND bucket_lon BETWEEN ? AND ?",
+                        (row_lat, range_lo, range_hi)).fetchall()
+                    for row in rows:
+                        distance = haversine_km(latitude, longitude, row[0], row[1])
+                        if distance <= max_distance_km:
+                            found.append((distance, _row_to_summary(row[2:])))
+        except sqlite3.OperationalError:
+            pass  # store not initialised yet
+        finally:
+            conn.close()
+
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def lookup(self, latitude, longitude, max_distance_km=0, max_neighbors=4):
+        # Exact grid bucket first; otherwise inverse-distance weighting of the
+        # nearest stored points within max_distance_km.
+        summary = self.get(latitude, longitude)
+        if summary is not None or max_distance_km <= 0:
+            return summary
+
+        nearest = self.neighbors(latitude, longitude, max_distance_km)[:max_neighbors]
+        if not nearest:
+            return None
+        if nearest[0][0] < 1e-3:
+            return nearest[0][1]
+
+        return blend_summaries([(1 / (distance ** 2), summary) for distance, summary in nearest])
+
+    def put_many(self, points):
+        # points: iterable of (latitude, longitude, summary)
+        now = datetime.utcnow().isoformat(timespec='seconds')
+        rows = []
+        for latitude, longitude, summary in points:
+            bucket_lat, bucket_lon = grid_bucket(latitude, longitude, self.grid_deg)
+            monthly_mean = json.dumps(summary['monthly_mean']) if summary.get('monthly_mean') else None
+            rows.append((bucket_lat, bucket_lon, latitude, longitude, summary['avg_irradiance'], now, monthly_mean,
+                         summary.get('p50'), summary.get('p90'), summary.get('variance'), summary.get('years')))
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.executemany("INSERT OR REPLACE INTO irradiance "
+                         "(bucket_lat, bucket_lon, latitude, longitude, avg_irradiance, fetched_at, "
+                         "monthly_mean, p50, p90, variance, years) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+
+    def put(self, latitude, longitude, summary):
+        self.put_many([(latitude, longitude, summary)])
+
+    def stored_buckets(self):
+        conn = sqlite3.connect(self.db_path)
+        buckets = set(conn.execute("SELECT bucket_lat, bucket_lon FROM irradiance").fetchall())
+        conn.close()
+        return buckets
@@ -0,0 +1,236 @@
+# jobs.py
+# Local background job queue for heavy analyses (multi-year simulations,
+# optimization sweeps, portfolio runs). Jobs are persisted in SQLite so they
+# survive restarts, and executed on a process pool so the web workers only
+# insert a row and return.
+import os
+import json
+import uuid
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# Processes in each web worker's job pool; by default the cores are split
+# between the gunicorn workers (see gunicorn.conf.py)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0)) or \
+    max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 2)))
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.utcnow().isoformat(timespec='seconds')
+
+
+def _run_job(db_path, job_id, handler, payload):
+    # Runs inside a pool process. Claiming the row (queued -> running) makes
+    # sure a job cancelled while waiting in the pool never starts, and that a
+    # job recovered by several web workers only runs once.
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+            (JOB_RUNNING, _now(), job_id, JOB_QUEUED)).rowcount
+        conn.commit()
+        if not claimed:
+            return
+
+        try:
+            result = handler(payload)
+            status, result_json, error = JOB_DONE, json.dumps(result), None
+        except Exception as e:
+            # Clients only see the exception type and message; the traceback
+            # goes to the server log
+            logger.exception('Job %s failed', job_id)
+            status, result_json, error = JOB_FAILED, None, f"{type(e).__name__}: {e}"[:500]
+
+        # A job cancelled while running keeps its 'cancelled' status; the
+        # result is simply discarded.
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (status, result_json, error, _now(), job_id, JOB_RUNNING))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    def __init__(self, db_path, max_workers=None):
+        self.db_path = db_path
+        self.max_workers = max_workers or JOB_WORKERS
+        self.handlers = {}
+        self.validators = {}
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                        (id TEXT PRIMARY KEY,
+                         job_type TEXT NOT NULL,
+                         payload TEXT,
+                         status TEXT NOT NULL,
+                         result TEXT,
+                         error TEXT,
+                         created_at TEXT,
+                         started_at TEXT,
+                         finished_at TEXT)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+        conn.commit()
+        conn.close()
+
+    def register(self, job_type, handler, validate=None):
+        # handler must be a module-level function so it can be sent to the pool.
+        # validate(payload), if given, runs at submit time and raises
+        # ValueError for payloads that should be rejected outright.
+        self.handlers[job_type] = handler
+        if validate is not None:
+            self.validators[job_type] = validate
+
+    def _get_executor(self):
+        # Created lazily so a pre-forking server never shares a pool between
+        # its workers.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        # A pool whose process died (e.g. killed by the OOM killer) rejects
+        # every later submit; drop it so the next dispatch starts a new one.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, job_id, job_type, payload, retry=True):
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_run_job, self.db_path, job_id, self.handlers[job_type], payload)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            if not retry:
+                raise
+            return self._dispatch(job_id, job_type, payload, retry=False)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._forget(job_id, job_type, payload, executor, f))
+
+    def _forget(self, job_id, job_type, payload, executor, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled() or not isinstance(future.exception(), BrokenProcessPool):
+            return
+
+        # The pool broke under this job. A job that had started may be the
+        # one that killed its process, so it is failed rather than retried;
+        # one still queued is dispatched again on a fresh pool.
+        self._discard_executor(executor)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                     (JOB_FAILED, 'worker process terminated abruptly', _now(), job_id, JOB_RUNNING))
+        requeue = conn.execute("SELECT 1 FROM jobs WHERE id = ? AND status = ?", (job_id, JOB_QUEUED)).fetchone()
+        conn.commit()
+        conn.close()
+        if requeue:
+            try:
+                self._dispatch(job_id, job_type, payload)
+            except BrokenProcessPool:
+                pass  # left queued for recover()
+
+    def submit(self, job_type, payload):
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if job_type in self.validators:
+            self.validators[job_type](payload)
+
+        job_id = uuid.uuid4().hex
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO jobs (id, job_type, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                     (job_id, job_type, json.dumps(payload), JOB_QUEUED, _now()))
+        conn.commit()
+        conn.close()
+
+        self._dispatch(job_id, job_type, payload)
+        return job_id
+
+    def get(self, job_id):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'type': row['job_type'],
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+        if row['status'] == JOB_DONE:
+            job['result'] = json.loads(row['result'])
+        elif row['status'] == JOB_FAILED:
+            job['error'] = row['error']
+        return job
+
+    def cancel(self, job_id):
+        # Cancellation only stops queued jobs. A running job is marked
+        # cancelled but keeps its pool process busy until it finishes; its
+        # result is then discarded.
+        conn = sqlite3.connect(self.db_path)
+        cancelled = conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (JOB_CANCELLED, _now(), job_id, JOB_QUEUED, JOB_RUNNING)).rowcount
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return bool(cancelled)
+
+    def reset_interrupted(self):
+        # Jobs marked running when the server (re)starts died with the old
+        # process; queue them again. Only call this before any worker runs
+        # jobs, e.g. once in the gunicorn master.
+        conn = sqlite3.connect(self.db_path)
+        reset = conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                             (JOB_QUEUED, JOB_RUNNING)).rowcount
+        conn.commit()
+        conn.close()
+        return reset
+
+    def recover(self):
+        # Re-dispatch queued jobs left behind by a previous process. Safe to
+        # call from every worker: a job only runs in the worker that claims it.
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT id, job_type, payload FROM jobs WHERE status = ? ORDER BY created_at",
+                            (JOB_QUEUED,)).fetchall()
+        conn.close()
+
+        recovered = 0
+        for job_id, job_type, payload in rows:
+            if job_type in self.handlers:
+                self._dispatch(job_id, job_type, json.loads(payload))
+                recovered += 1
+        return recovered
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,246 @@
+# loadtest.py
+# Capacity test: runs the app under gunicorn with different worker/thread
+# counts against local stand-ins for NASA POWER and OpenWeatherMap, drives a
+# realistic traffic mix and reports throughput and p50/p95/p99 latency per
+# configuration.
+#
+#   python loadtest.py --workers 1,2,4 --threads 1,4 --duration 20 \
+#       --upstream-latency 0.3 --upstream-failure-rate 0.05
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_APPLIANCES = [
+    {'name': 'LED Lights', 'wattage': 60, 'hours': 8, 'quantity': 10},
+    {'name': 'Refrigerator', 'wattage': 150, 'hours': 24, 'quantity': 1},
+    {'name': 'Air Conditioner', 'wattage': 1500, 'hours': 8, 'quantity': 2},
+    {'name': 'TV', 'wattage': 100, 'hours': 6, 'quantity': 2},
+    {'name': 'Fan', 'wattage': 75, 'hours': 12, 'quantity': 5}
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def nasa_body():
+    # Same date range the app requests, with the occasional -999 fill value
+    from irradiance import START_YEAR, END_YEAR
+    day, end = date(START_YEAR, 1, 1), date(END_YEAR, 12, 31)
+    values = {}
+    while day <= end:
+        values[day.strftime('%Y%m%d')] = -999.0 if random.random() < 0.01 else round(random.uniform(150, 300), 2)
+        day += timedelta(days=1)
+    return json.dumps({'properties': {'parameter': {'ALLSKY_SFC_SW_DWN': values}}}).encode()
+
+
+def weather_body():
+    return json.dumps({
+        'main': {'temp': 28.5, 'humidity': 40},
+        'clouds': {'all': 20},
+        'weather': [{'description': 'few clouds'}]
+    }).encode()
+
+
+def start_mock_upstream(latency, failure_rate):
+    # One server answers both upstreams: /nasa and /weather
+    bodies = {'/nasa': nasa_body(), '/weather': weather_body()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency * random.uniform(0.5, 1.5))
+            body = bodies.get(self.path.split('?')[0])
+            if body is None or random.random() < failure_rate:
+                self.send_response(503 if body is not None else 404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(workers, threads, upstream_port, db_path, extra_env=None):
+    port = free_port()
+    env = dict(os.environ,
+               SOLAR_DB_PATH=db_path,
+               GAZETTEER_PATH=os.path.join(os.path.dirname(db_path), 'gazetteer.idx'),
+               NASA_POWER_URL=f'http://127.0.0.1:{upstream_port}/nasa',
+               OPENWEATHER_URL=f'http://127.0.0.1:{upstream_port}/weather',
+               OPENWEATHER_API_KEY='loadtest',
+               WARMUP_COORDINATES='')
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:app', '-b', f'127.0.0.1:{port}',
+         '-w', str(workers), '--threads', str(threads), '--log-level', 'warning'],
+        cwd=HERE, env=env)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def wait_ready(base_url, session, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if session.get(base_url + '/', timeout=1).status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'app did not start at {base_url}')
+
+
+def make_request(kind, base_url, session, locations):
+    lat, lon = random.choice(locations)
+    if kind == 'calculate':
+        appliances = random.sample(SAMPLE_APPLIANCES, random.randint(2, len(SAMPLE_APPLIANCES)))
+        return session.post(base_url + '/api/calculate',
+                            json={'appliances': appliances, 'latitude': lat, 'longitude': lon}, timeout=60)
+    if kind == 'weather':
+        return session.post(base_url + '/api/weather', json={'latitude': lat, 'longitude': lon}, timeout=60)
+    return session.get(base_url + '/', timeout=60)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def drive(base_url, mix, concurrency, duration, locations):
+    import requests
+
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client():
+        session = requests.Session()
+        while time.time() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = make_request(kind, base_url, session, locations).status_code < 500
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[kind].append(elapsed)
+                if not ok:
+                    errors[kind] += 1
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.time() - started
+
+    report = {}
+    for kind in kinds + ['all']:
+        values = sorted(sum(latencies.values(), []) if kind == 'all' else latencies[kind])
+        failed = sum(errors.values()) if kind == 'all' else errors[kind]
+        report[kind] = {
+            'requests': len(values),
+            'errors': failed,
+            'rps': round(len(values) / wall, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 1),
+            'p95_ms': round(percentile(values, 95) * 1000, 1),
+            'p99_ms': round(percentile(values, 99) * 1000, 1)
+        }
+    return report
+
+
+def run_config(workers, threads, args, upstream_port, locations):
+    import requests
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process, base_url = start_app(workers, threads, upstream_port, os.path.join(tmp, 'loadtest.db'))
+        try:
+            wait_ready(base_url, requests.Session())
+            return drive(base_url, args.mix, args.concurrency, args.duration, locations)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, weight = part.split('=')
+        if kind not in ('calculate', 'weather', 'index'):
+            raise argparse.ArgumentTypeError(f'unknown request kind: {kind}')
+        mix[kind] = float(weight)
+    return mix
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the app under gunicorn with mocked upstreams.')
+    parser.add_argument('--workers', type=parse_ints, default=[1, 2, 4])
+    parser.add_argument('--threads', type=parse_ints, default=[1])
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per configuration')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('calculate=6,weather=3,index=1'))
+    parser.add_argument('--locations', type=int, default=50, help='distinct coordinates in the traffic')
+    parser.add_argument('--upstream-latency', type=float, default=0.2, help='mean upstream latency in seconds')
+    parser.add_argument('--upstream-failure-rate', type=float, default=0.0)
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    args = parser.parse_args(argv)
+
+    locations = [(round(random.uniform(-50, 60), 4), round(random.uniform(-180, 180), 4)) for _ in range(args.locations)]
+    upstream = start_mock_upstream(args.upstream_latency, args.upstream_failure_rate)
+
+    results = []
+    try:
+        for workers in args.workers:
+            for threads in args.threads:
+                print(f'running workers={workers} threads={threads} for {args.duration}s...', file=sys.stderr)
+                report = run_config(workers, threads, args, upstream.server_address[1], locations)
+                results.append({'workers': workers, 'threads': threads, 'report': report})
+    finally:
+        upstream.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{'workers':>7} {'threads':>7} {'kind':>10} {'requests':>8} {'errors':>6} {'rps':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        for kind, stats in result['report'].items():
+            print(f"{result['workers']:>7} {result['threads']:>7} {kind:>10} {stats['requests']:>8} {stats['errors']:>6} "
+                  f"{stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+# main.py
+# WSGI entry point used by the Procfile (gunicorn main:app).
+from app import create_app
+
+app = create_app()
@@ -0,0 +1,440 @@
+# meter_data.py
+# Smart-meter interval data as the consumption source. Meter exports are
+# stream-parsed and aggregated in one pass into NumPy daily, monthly and
+# hour-of-day load arrays. Interval rows are read in fixed-size blocks that
+# are split into columns in bulk and converted column-wise (distinct
+# date/time strings are parsed once), so memory stays flat and there is
+# almost no per-row Python work, even for multi-year files.
+#
+# Recognised layouts:
+#   - long:  one interval per row, a start timestamp (or date + start time)
+#            and a usage column, e.g. Green Button CSV
+#            (TYPE,DATE,START TIME,END TIME,USAGE (kWh),...) or
+#            "Consumption (kWh),Start,End"
+#   - wide:  one day per row, a date column then one column per interval
+#            headed with its time (00:00,00:30,... or 00:30,...,24:00)
+#   - NEM12: the Australian 100/200/300 record format
+#
+#   python meter_data.py usage.csv
+import io
+import re
+import csv
+import sys
+import json
+import uuid
+import sqlite3
+import argparse
+from datetime import date, datetime
+
+# Characters of interval rows read and converted per block
+BLOCK_CHARS = 1 << 20
+
+# Lines searched for the header row (utility exports often start with
+# account details)
+MAX_PREAMBLE_ROWS = 30
+
+TIME_HEADER = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+
+def _header(name):
+    return name.strip().lower()
+
+
+def _unit_scale(name):
+    # Values in Wh are converted to kWh
+    name = _header(name)
+    return 0.001 if 'wh' in name and 'kwh' not in name else 1.0
+
+
+def _find(headers, predicates):
+    # Index of the first header matching the earliest predicate, or None
+    for predicate in predicates:
+        for i, name in enumerate(headers):
+            if predicate(name):
+                return i
+    return None
+
+
+class LoadAccumulator:
+    # One-pass aggregation of (day, hour, kWh) into per-day totals and an
+    # hour-of-day profile
+    def __init__(self):
+        import numpy as np
+
+        self.daily = {}
+        self.hour_sum = np.zeros(24)
+        self.intervals = 0
+
+    def add_intervals(self, days, hours, values):
+        # days: day ordinals, hours: hour of day, values: kWh (equal-length arrays)
+        import numpy as np
+
+        if not len(values):
+            return
+        first = int(days.min())
+        offsets = days - first
+        totals = np.bincount(offsets, weights=values)
+        for offset in np.flatnonzero(np.bincount(offsets)).tolist():
+            day = first + offset
+            self.daily[day] = self.daily.get(day, 0.0) + float(totals[offset])
+        self.hour_sum += np.bincount(hours, weights=values, minlength=24)
+        self.intervals += len(values)
+
+    def add_day(self, day, hours, values):
+        import numpy as np
+
+        self.daily[day] = self.daily.get(day, 0.0) + float(values.sum())
+        self.hour_sum += np.bincount(hours, weights=values, minlength=24)
+        self.intervals += len(values)
+
+    def finish(self, fmt, rows):
+        import numpy as np
+
+        if not self.daily:
+            raise ValueError("no interval readings found")
+
+        ordinals = np.array(sorted(self.daily))
+        daily_kwh = np.array([self.daily[day] for day in ordinals.tolist()])
+        dates = [date.fromordinal(day) for day in (ordinals[0], ordinals[-1])]
+        # Months as year * 12 + month index, summed per calendar month
+        month_keys = np.array([d.year * 12 + d.month - 1 for d in map(date.fromordinal, ordinals.tolist())])
+        months, month_index = np.unique(month_keys, return_inverse=True)
+
+        return {
+            'format': fmt,
+            'rows': rows,
+            'intervals': self.intervals,
+            'start': dates[0].isoformat(),
+            'end': dates[1].isoformat(),
+            'day_ordinals': ordinals,
+            'daily_kwh': daily_kwh,
+            'months': [f'{key // 12:04d}-{key % 12 + 1:02d}' for key in months.tolist()],
+            'monthly_kwh': np.bincount(month_index, weights=daily_kwh),
+            'hourly_profile_kwh': self.hour_sum / len(ordinals)  # average kWh per hour of day
+        }
+
+
+class _DateParser:
+    # Date strings repeat once per interval, so each distinct string is
+    # parsed once and cached as a day ordinal.
+    def __init__(self, day_first=False):
+        self.day_first = day_first
+        self.cache = {}
+
+    def __call__(self, text):
+        ordinal = self.cache.get(text)
+        if ordinal is None:
+            ordinal = self.cache[text] = self._parse(text.strip())
+        return ordinal
+
+    def _parse(self, text):
+        if len(text) == 8 and text.isdigit():
+            return date(int(text[:4]), int(text[4:6]), int(text[6:])).toordinal()
+        parts = re.split(r'[-/.]', text)
+        if len(parts) != 3:
+            raise ValueError(f"unrecognised date: {text!r}")
+        a, b, c = (int(p) for p in parts)
+        if len(parts[0]) == 4:
+            return date(a, b, c).toordinal()
+        year = c + 2000 if c < 100 else c
+        day, month = (a, b) if self.day_first else (b, a)
+        return date(year, month, day).toordinal()
+
+
+class _TimeParser:
+    # Time of day -> minutes after midnight, cached per distinct string
+    def __init__(self):
+        self.cache = {}
+
+    def __call__(self, text):
+        minutes = self.cache.get(text)
+        if minutes is None:
+            minutes = self.cache[text] = self._parse(text.strip())
+        return minutes
+
+    def _parse(self, text):
+        text = re.split(r'[+Z]|(?<=\d)-(?=\d\d:?\d\d$)', text)[0].strip()  # drop UTC offsets
+        suffix = text[-2:].upper()
+        if suffix in ('AM', 'PM'):
+            text = text[:-2].strip()
+        fields = text.split(':') if text else ['0']
+        hour, minute = int(fields[0]), int(fields[1]) if len(fields) > 1 else 0
+        if suffix == 'PM' and hour < 12:
+            hour += 12
+        elif suffix == 'AM' and hour == 12:
+            hour = 0
+        return hour * 60 + minute
+
+
+def _to_floats(texts, scale):
+    # Column of number strings -> (values, valid mask); blanks and junk are dropped
+    import numpy as np
+
+    try:
+        values = np.fromiter(map(float, texts), dtype=float, count=len(texts))
+    except ValueError:
+        values = np.array([_float_or_nan(text) for text in texts])
+    return values * scale, ~np.isnan(values)
+
+
+def _float_or_nan(text):
+    try:
+        return float(text)
+    except ValueError:
+        return float('nan')
+
+
+def _lookup(parse, texts):
+    # Parse each distinct string once, then map the column through the
+    # results; unparseable strings become -1
+    import numpy as np
+
+    parsed = {}
+    for text in dict.fromkeys(texts):
+        try:
+            parsed[text] = parse(text)
+        except (ValueError, IndexError):
+            parsed[text] = -1
+    return np.fromiter(map(parsed.__getitem__, texts), dtype=np.int64, count=len(texts))
+
+
+def _column_blocks(stream, width):
+    # Columns of the remaining rows, one block of whole lines at a time.
+    # Unquoted blocks with a constant field count are split in bulk; anything
+    # else (quoted fields, blank or short lines) goes through the csv module.
+    rest = ''
+    while True:
+        data = stream.read(BLOCK_CHARS)
+        block = rest + data
+        cut = block.rfind('\n') + 1 if data else len(block)
+        block, rest = block[:cut], block[cut:]
+        if block:
+            if not block.endswith('\n'):
+                block += '\n'
+            lines = block.count('\n')
+            columns = None
+            if '"' not in block:
+                fields = block.replace('\r', '').replace('\n', ',').split(',')
+                fields.pop()  # after the final newline
+                count = len(fields) // lines
+                if count > width and count * lines == len(fields):
+                    columns = [fields[i::count] for i in range(count)]
+            if columns is None:
+                rows = [row for row in csv.reader(io.StringIO(block)) if len(row) > width]
+                columns = [list(column) for column in zip(*rows)]
+            yield lines, columns
+        if not data:
+            return
+
+
+def _split_timestamps(texts, separator):
+    # Date and time parts of "<date><separator><time>" strings, split in bulk
+    joined = '\n'.join(texts)
+    parts = joined.replace(separator, '\n').split('\n')
+    if len(parts) == 2 * len(texts):
+        return parts[0::2], parts[1::2]
+    # Missing or repeated separators: split row by row
+    parts = [text.strip().partition(separator) for text in texts]
+    return [part[0] for part in parts], [part[2] or '0:00' for part in parts]
+
+
+def _parse_long(stream, headers, acc, parse_date, rows):
+    import numpy as np
+
+    names = [_header(h) for h in headers]
+    value_col = _find(names, [lambda n: 'kwh' in n and 'cost' not in n,
+                              lambda n: n.startswith(('usage', 'consumption', 'import', 'energy')),
+                              lambda n: n in ('value', 'reading', 'wh', 'kw')])
+    time_col = _find(names, [lambda n: n in ('start time', 'start_time', 'time', 'interval start time')])
+    if time_col is not None:
+        ts_col = _find(names, [lambda n: 'date' in n and 'time' not in n and 'end' not in n])
+        end_labelled = False
+    else:
+        ts_col = _find(names, [lambda n: 'start' in n, lambda n: n in ('timestamp', 'datetime', 'date time', 'date'),
+                               lambda n: 'time' in n or 'date' in n, lambda n: 'end' in n])
+        end_labelled = ts_col is not None and 'end' in names[ts_col]
+    if value_col is None or ts_col is None:
+        raise ValueError("could not find the timestamp and usage columns")
+
+    scale = _unit_scale(headers[value_col])
+    parse_time = _TimeParser()
+    width = max(value_col, ts_col, time_col or 0)
+    separator = None
+    for lines, columns in _column_blocks(stream, width):
+        rows += lines
+        if not columns:
+            continue
+
+        values, valid = _to_floats(columns[value_col], scale)
+        if time_col is not None:
+            day_texts, time_texts = columns[ts_col], columns[time_col]
+        else:
+            # One timestamp column: split on the date/time separator seen first
+            if separator is None:
+                separator = 'T' if 'T' in columns[ts_col][0] else ' '
+            day_texts, time_texts = _split_timestamps(columns[ts_col], separator)
+
+        days = _lookup(parse_date, day_texts)
+        minutes = _lookup(parse_time, time_texts)
+        valid &= (days >= 0) & (minutes >= 0)
+        if end_labelled:
+            minutes = minutes - 1  # an interval ending at 00:00 belongs to the previous day
+            days = np.where(minutes < 0, days - 1, days)
+            minutes = np.where(minutes < 0, 1439, minutes)
+        acc.add_intervals(days[valid], (minutes[valid] // 60) % 24, values[valid])
+    return rows
+
+
+def _parse_wide(reader, headers, acc, parse_date, rows):
+    import numpy as np
+
+    names = [_header(h) for h in headers]
+    interval_cols = [i for i, n in enumerate(names) if TIME_HEADER.match(n)]
+    date_col = _find(names, [lambda n: 'date' in n]) or 0
+    minutes = np.array([int(TIME_HEADER.match(names[i]).group(1)) * 60 + int(TIME_HEADER.match(names[i]).group(2))
+                        for i in interval_cols])
+    if minutes[0] > 0:
+        minutes = minutes - 1  # headed with each interval's end time
+    hours = (minutes // 60 % 24).astype(int)
+    scale = _unit_scale(' '.join(headers))
+    first, last = interval_cols[0], interval_cols[-1] + 1
+
+    for row in reader:
+        rows += 1
+        if len(row) < last:
+            continue
+        try:
+            values = np.array([float(v or 0) for v in row[first:last]]) * scale
+            day = parse_date(row[date_col])
+        except ValueError:
+            continue
+        acc.add_day(day, hours, values)
+    return rows
+
+
+def _parse_nem12(reader, acc, parse_date, rows):
+    # 200 records set the register (consumption suffixes start with E), unit
+    # and interval length for the 300 (interval data) records that follow
+    import numpy as np
+
+    interval, scale, consumption, hours = 30, 1.0, True, None
+    for row in reader:
+        rows += 1
+        if not row:
+            continue
+        if row[0] == '200' and len(row) > 8:
+            consumption = row[4].upper().startswith('E')
+            scale = 0.001 if row[7].strip().upper() == 'WH' else 1.0
+            interval = int(row[8] or 30)
+            hours = (np.arange(1440 // interval) * interval // 60).astype(int)
+        elif row[0] == '300' and consumption and hours is not None:
+            try:
+                values = np.array([float(v or 0) for v in row[2:2 + len(hours)]]) * scale
+                day = parse_date(row[1])
+            except ValueError:
+                continue
+            acc.add_day(day, hours[:len(values)], values)
+    return rows
+
+
+def parse_meter_csv(stream, day_first=False):
+    # stream: binary or text file object. Returns the aggregated load (see
+    # LoadAccumulator.finish); raises ValueError for unrecognised files.
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    reader = csv.reader(stream)
+    acc = LoadAccumulator()
+    parse_date = _DateParser(day_first)
+
+    rows = 0
+    for row in reader:
+        rows += 1
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if row[0] == '100' and any('NEM12' in cell.upper() for cell in row):
+            return acc.finish('nem12', _parse_nem12(reader, acc, parse_date, rows))
+        names = [_header(cell) for cell in row]
+        if sum(1 for name in names if TIME_HEADER.match(name)) >= 24:
+            return acc.finish('wide', _parse_wide(reader, row, acc, parse_date, rows))
+        if any('date' in n or 'start' in n or 'end' in n or 'time' in n for n in names) and \
+                any('kwh' in n or n.startswith(('usage', 'consumption', 'import', 'energy', 'value')) for n in names):
+            return acc.finish('long', _parse_long(stream, row, acc, parse_date, rows))
+        if rows >= MAX_PREAMBLE_ROWS:
+            break
+    raise ValueError("unrecognised meter data format")
+
+
+def load_summary(load):
+    # JSON-ready view of a parsed load; sizing uses avg_daily_kwh
+    daily = load['daily_kwh']
+    days = len(daily)
+    total = float(daily.sum())
+    return {
+        'format': load['format'],
+        'intervals': load['intervals'],
+        'start': load['start'],
+        'end': load['end'],
+        'days': days,
+        'total_kwh': round(total, 2),
+        'avg_daily_kwh': round(total / days, 3),
+        'peak_daily_kwh': round(float(daily.max()), 3),
+        'monthly_kwh': [{'month': month, 'kwh': round(value, 2)}
+                        for month, value in zip(load['months'], load['monthly_kwh'].tolist())],
+        'hourly_profile_kwh': [round(value, 4) for value in load['hourly_profile_kwh'].tolist()]
+    }
+
+
+class MeterStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS meter_loads
+                        (meter_id TEXT PRIMARY KEY,
+                         user_session TEXT,
+                         summary TEXT NOT NULL,
+                         uploaded_at TEXT)''')
+        conn.commit()
+        conn.close()
+
+    def get(self, meter_id):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT summary FROM meter_loads WHERE meter_id = ?", (meter_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+    def put(self, summary, user_session=None):
+        meter_id = uuid.uuid4().hex
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO meter_loads VALUES (?, ?, ?, ?)",
+                     (meter_id, user_session, json.dumps(summary), datetime.utcnow().isoformat(timespec='seconds')))
+        conn.commit()
+        conn.close()
+        return meter_id
+
+    def delete(self, meter_id):
+        conn = sqlite3.connect(self.db_path)
+        deleted = conn.execute("DELETE FROM meter_loads WHERE meter_id = ?", (meter_id,)).rowcount
+        conn.commit()
+        conn.close()
+        return bool(deleted)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise a smart-meter interval export.')
+    parser.add_argument('file')
+    parser.add_argument('--day-first', action='store_true', help='slash dates are DD/MM/YYYY')
+    args = parser.parse_args(argv)
+
+    started = datetime.now()
+    with open(args.file, 'rb') as f:
+        summary = load_summary(parse_meter_csv(f, day_first=args.day_first))
+    seconds = (datetime.now() - started).total_seconds()
+    print(json.dumps(summary, indent=2))
+    print(f"parsed {summary['intervals']} intervals in {seconds:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
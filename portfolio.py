@@ -0,0 +1,198 @@
+# portfolio.py
+# Multi-site portfolio evaluation: every site goes through the regular
+# calculation pipeline on a process pool, and per-site results are folded
+# into fleet-wide totals as they complete.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from irradiance import grid_bucket, GRID_DEG
+
+DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# Processes in each web worker's portfolio pool; by default the cores are
+# split between the gunicorn workers (see gunicorn.conf.py)
+PORTFOLIO_WORKERS = int(os.environ.get('PORTFOLIO_WORKERS', 0)) or \
+    max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 2)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # One pool per web worker, shared by all portfolio requests and created
+    # on first use so a pre-forking server never shares it between workers
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PORTFOLIO_WORKERS)
+        return _pool
+
+
+def _discard_pool(pool):
+    # A pool whose process died rejects every later submit; the next request
+    # starts a new one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_chunks(sites, max_workers, grid_deg=GRID_DEG):
+    # Sites in the same grid cell travel together so one process resolves the
+    # cell's irradiance once; large cells are split so no core sits idle.
+    groups = {}
+    for index, site in enumerate(sites):
+        try:
+            bucket = grid_bucket(site.get('latitude', 0), site.get('longitude', 0), grid_deg)
+        except (AttributeError, TypeError, ValueError):
+            bucket = None  # invalid site; reported as an error by the calculation
+        groups.setdefault(bucket, []).append((index, site))
+
+    chunk_size = max(1, -(-len(sites) // (max_workers * 4)))
+    chunks = []
+    for members in groups.values():
+        for start in range(0, len(members), chunk_size):
+            chunks.append(members[start:start + chunk_size])
+    return groups, chunks
+
+
+def _evaluate_chunk(calculate, chunk):
+    results = []
+    for index, site in chunk:
+        try:
+            results.append((index, calculate(site), None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
+def site_summary(result):
+    production = result['production_estimate']
+    return {
+        'yearly_production_kwh': production['yearly_kwh'],
+        'monthly_production_kwh': production.get('monthly_kwh_profile') or
+                                  [round(production['daily_kwh'] * days, 2) for days in DAYS_IN_MONTH],
+        'total_cost': result['cost_roi']['total_cost'],
+        'yearly_co2_savings_kg': result['co2_savings']['yearly_co2_savings_kg'],
+        'yearly_grid_import_kwh': round(result['grid_analysis']['daily_grid_import_kwh'] * 365, 2)
+    }
+
+
+class PortfolioTotals:
+    def __init__(self, site_count):
+        self.site_count = site_count
+        self.completed = 0
+        self.failed = 0
+        self.yearly_production_kwh = 0.0
+        self.total_cost = 0.0
+        self.yearly_co2_savings_kg = 0.0
+        self.yearly_grid_import_kwh = 0.0
+        self.monthly_production_kwh = [0.0] * 12
+
+    def add(self, summary):
+        self.completed += 1
+        if summary is None:
+            self.failed += 1
+            return
+        self.yearly_production_kwh += summary['yearly_production_kwh']
+        self.total_cost += summary['total_cost']
+        self.yearly_co2_savings_kg += summary['yearly_co2_savings_kg']
+        self.yearly_grid_import_kwh += summary['yearly_grid_import_kwh']
+        for month, value in enumerate(summary['monthly_production_kwh']):
+            self.monthly_production_kwh[month] += value
+
+    def as_dict(self):
+        return {
+            'sites': self.site_count,
+            'completed': self.completed,
+            'failed': self.failed,
+            'yearly_production_kwh': round(self.yearly_production_kwh, 2),
+            'total_cost': round(self.total_cost, 2),
+            'yearly_co2_savings_kg': round(self.yearly_co2_savings_kg, 2),
+            'yearly_co2_savings_tons': round(self.yearly_co2_savings_kg / 1000, 2),
+            'yearly_grid_import_kwh': round(self.yearly_grid_import_kwh, 2),
+            'monthly_production_kwh': [round(value, 2) for value in self.monthly_production_kwh]
+        }
+
+
+def iter_portfolio(sites, calculate, warm=None, max_workers=None, warm_concurrency=4, shared_pool=True):
+    # Yields (site_result, totals) as sites complete. warm(lat, lon) is called
+    # once per grid cell up front so the pool processes read irradiance from
+    # the local store instead of each fetching it. warm_concurrency should not
+    # exceed what the upstream admits at once, or warm calls are shed and the
+    # cells are fetched again by the pool processes. shared_pool=False runs
+    # on a pool of its own that is shut down afterwards (background jobs,
+    # whose processes must be able to exit).
+    max_workers = max_workers or PORTFOLIO_WORKERS
+    groups, chunks = plan_chunks(sites, max_workers)
+    totals = PortfolioTotals(len(sites))
+
+    if warm is not None:
+        def warm_cell(members):
+            site = members[0][1]
+            try:
+                warm(float(site.get('latitude', 0)), float(site.get('longitude', 0)))
+            except Exception:
+                pass  # the site calculation applies its own fallback
+        cells = [members for bucket, members in groups.items() if bucket is not None]
+        with ThreadPoolExecutor(max_workers=max(1, min(warm_concurrency, len(cells)))) as pool:
+            list(pool.map(warm_cell, cells))
+
+    def to_site_result(index, result, error):
+        site = sites[index]
+        site_id = site.get('site_id', index) if isinstance(site, dict) else index
+        site_result = {'index': index, 'site_id': site_id}
+        if error is not None:
+            site_result['error'] = error
+            totals.add(None)
+        else:
+            summary = site_summary(result)
+            site_result.update(summary)
+            totals.add(summary)
+        return site_result
+
+    if max_workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            for index, result, error in _evaluate_chunk(calculate, chunk):
+                yield to_site_result(index, result, error), totals
+        return
+
+    if shared_pool:
+        pool = _get_pool()
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(max_workers, len(chunks)))
+    futures = []
+    try:
+        try:
+            futures = [pool.submit(_evaluate_chunk, calculate, chunk) for chunk in chunks]
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        for future in as_completed(futures):
+            try:
+                chunk_results = future.result()
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                raise
+            for index, result, error in chunk_results:
+                yield to_site_result(index, result, error), totals
+    finally:
+        # The client may stop reading a streamed portfolio; drop its
+        # remaining chunks from the pool
+        for future in futures:
+            future.cancel()
+        if not shared_pool:
+            pool.shutdown(wait=True)
+
+
+def evaluate_portfolio(sites, calculate, warm=None, max_workers=None, warm_concurrency=4, shared_pool=True):
+    site_results = []
+    totals = PortfolioTotals(len(sites))
+    for site_result, totals in iter_portfolio(sites, calculate, warm=warm, max_workers=max_workers,
+                                              warm_concurrency=warm_concurrency, shared_pool=shared_pool):
+        site_results.append(site_result)
+    site_results.sort(key=lambda r: r['index'])
+    return {'sites': site_results, 'totals': totals.as_dict()}
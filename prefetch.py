@@ -0,0 +1,119 @@
+# prefetch.py
+# Preload NASA POWER irradiance for a list of coordinates into the local
+# store, so live requests in a new region never wait on the upstream.
+#
+#   python prefetch.py coordinates.csv --concurrency 16
+#
+# The input is a CSV/text file with latitude,longitude per line (a header row
+# is skipped). Coordinates are deduplicated by grid bucket, and buckets that
+# are already stored are skipped, so re-running an interrupted prefetch
+# resumes where it stopped. Buckets use IRRADIANCE_GRID_DEG, the same grid
+# size the app reads with.
+import os
+import sys
+import csv
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from irradiance import IrradianceStore, grid_bucket, fetch_with_retries
+
+
+def read_coordinates(path):
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                yield float(row[0]), float(row[1])
+            except ValueError:
+                continue  # header or malformed line
+
+
+def plan_buckets(coordinates, done, grid_deg):
+    # One representative coordinate per bucket not fetched yet
+    pending = {}
+    total = 0
+    for latitude, longitude in coordinates:
+        total += 1
+        bucket = grid_bucket(latitude, longitude, grid_deg)
+        if bucket not in done and bucket not in pending:
+            pending[bucket] = (latitude, longitude)
+    return total, list(pending.values())
+
+
+def prefetch(coordinates, store, concurrency=8, retries=3, backoff=1.0, timeout=10,
+             checkpoint_every=50, out=sys.stdout):
+    import requests
+
+    store.init_db()
+    done = store.stored_buckets()
+    total, pending = plan_buckets(coordinates, done, store.grid_deg)
+    print(f"{total} coordinates, {len(pending) + len(done)} buckets, "
+          f"{len(done)} already stored, {len(pending)} to fetch", file=out)
+
+    fetched, failed = 0, 0
+    batch = []
+    started = time.time()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(fetch_with_retries, lat, lon, session, retries, backoff, timeout): (lat, lon)
+                   for lat, lon in pending}
+        for future in as_completed(futures):
+            lat, lon = futures[future]
+            try:
+                batch.append((lat, lon, future.result()))
+                fetched += 1
+            except Exception as e:
+                failed += 1
+                print(f"failed {lat},{lon}: {e}", file=out)
+
+            # Committed results are the checkpoint: a re-run skips them
+            if len(batch) >= checkpoint_every:
+                store.put_many(batch)
+                batch = []
+
+            finished = fetched + failed
+            if finished % checkpoint_every == 0 or finished == len(pending):
+                elapsed = max(time.time() - started, 1e-9)
+                print(f"[{finished}/{len(pending)}] {fetched} ok, {failed} failed, "
+                      f"{finished / elapsed:.1f} buckets/s", file=out)
+
+    if batch:
+        store.put_many(batch)
+
+    elapsed = time.time() - started
+    return {
+        'coordinates': total,
+        'already_stored': len(done),
+        'fetched': fetched,
+        'failed': failed,
+        'seconds': round(elapsed, 2),
+        'buckets_per_second': round(fetched / elapsed, 2) if elapsed > 0 else 0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prefetch NASA POWER irradiance into the local store.')
+    parser.add_argument('input', help='CSV file with latitude,longitude per line')
+    parser.add_argument('--db', default=os.environ.get('SOLAR_DB_PATH', 'solar_data.db'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=1.0, help='base backoff in seconds')
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    store = IrradianceStore(args.db)
+    summary = prefetch(read_coordinates(args.input), store, concurrency=args.concurrency,
+                       retries=args.retries, backoff=args.backoff, timeout=args.timeout)
+    print(f"done: {summary['fetched']} fetched, {summary['failed']} failed, "
+          f"{summary['already_stored']} skipped in {summary['seconds']}s "
+          f"({summary['buckets_per_second']} buckets/s)")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
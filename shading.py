@@ -0,0 +1,116 @@
+# shading.py
+# Horizon / shading losses from nearby buildings and terrain.
+# A horizon profile is a list of obstruction elevations (degrees) for equal
+# azimuth bins, starting at north and going clockwise. It is applied as a
+# mask over a year of hourly sun positions: beam irradiance is lost whenever
+# the sun is below the horizon of its bin.
+import json
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+# Share of daily irradiance arriving as direct beam; the diffuse remainder is
+# treated as unshaded.
+BEAM_FRACTION = 0.7
+
+# Sun-position tables are computed per latitude band and reused
+LATITUDE_BAND_DEG = 1.0
+
+MAX_HORIZON_BINS = 360
+
+
+def parse_horizon_profile(profile):
+    # Accepts a list of elevations or {"elevations": [...]}. Raises ValueError.
+    if isinstance(profile, dict):
+        profile = profile.get('elevations')
+    if not isinstance(profile, (list, tuple)) or not 4 <= len(profile) <= MAX_HORIZON_BINS:
+        raise ValueError(f"horizon profile must be a list of 4 to {MAX_HORIZON_BINS} elevations")
+    try:
+        elevations = [float(value) for value in profile]
+    except (TypeError, ValueError):
+        raise ValueError("horizon elevations must be numbers")
+    if any(value < 0 or value > 90 for value in elevations):
+        raise ValueError("horizon elevations must be between 0 and 90 degrees")
+    return elevations
+
+
+@lru_cache(maxsize=256)
+def sun_position_table(latitude_band):
+    # Hourly sun elevation/azimuth (degrees, azimuth clockwise from north) for
+    # a year at the band's centre latitude, plus each hour's beam weight.
+    # Only hours with the sun above the geometric horizon are kept.
+    import numpy as np
+
+    latitude = np.radians(latitude_band * LATITUDE_BAND_DEG)
+    day = np.repeat(np.arange(1, 366), 24)
+    hour = np.tile(np.arange(24) + 0.5, 365)
+
+    declination = np.radians(23.45) * np.sin(np.radians(360 / 365 * (284 + day)))
+    hour_angle = np.radians(15 * (hour - 12))
+
+    sin_elevation = (np.sin(latitude) * np.sin(declination)
+                     + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle))
+    elevation = np.degrees(np.arcsin(np.clip(sin_elevation, -1, 1)))
+    azimuth = (np.degrees(np.arctan2(np.sin(hour_angle),
+                                     np.cos(hour_angle) * np.sin(latitude)
+                                     - np.tan(declination) * np.cos(latitude))) + 180) % 360
+
+    up = elevation > 0
+    elevation, azimuth = elevation[up], azimuth[up]
+    weight = np.sin(np.radians(elevation))  # beam on a horizontal surface
+    for array in (elevation, azimuth, weight):
+        array.setflags(write=False)
+    return elevation, azimuth, weight
+
+
+def shaded_beam_fraction(latitude, horizon):
+    # Share of the year's beam irradiance blocked by the horizon profile
+    import numpy as np
+
+    elevation, azimuth, weight = sun_position_table(int(round(float(latitude) / LATITUDE_BAND_DEG)))
+    profile = np.asarray(horizon, dtype=float)
+    bins = (azimuth * len(profile) / 360).astype(int) % len(profile)
+    blocked = elevation < profile[bins]
+    total = weight.sum()
+    return float(weight[blocked].sum() / total) if total > 0 else 0.0
+
+
+def shading_factor(latitude, horizon):
+    # Multiplier for daily irradiance (1.0 = no shading)
+    if not horizon:
+        return 1.0
+    return 1.0 - BEAM_FRACTION * shaded_beam_fraction(latitude, horizon)
+
+
+class HorizonStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS horizon_profiles
+                        (site_id TEXT PRIMARY KEY,
+                         elevations TEXT NOT NULL,
+                         updated_at TEXT)''')
+        conn.commit()
+        conn.close()
+
+    def get(self, site_id):
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT elevations FROM horizon_profiles WHERE site_id = ?", (site_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+    def put(self, site_id, elevations):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT OR REPLACE INTO horizon_profiles VALUES (?, ?, ?)",
+                     (site_id, json.dumps(elevations), datetime.utcnow().isoformat(timespec='seconds')))
+        conn.commit()
+        conn.close()
+
+    def delete(self, site_id):
+        conn = sqlite3.connect(self.db_path)
+        deleted = conn.execute("DELETE FROM horizon_profiles WHERE site_id = ?", (site_id,)).rowcount
+        conn.commit()
+        conn.close()
+        return bool(deleted)
@@ -0,0 +1,85 @@
+# weather_cache.py
+# Stale-while-revalidate cache for current weather conditions.
+# Nearby coordinates share one entry (spatial bucket), fresh entries are
+# served directly, stale entries are served immediately while a background
+# thread refreshes them, and a failed refresh keeps the last good value.
+import time
+import threading
+from collections import OrderedDict
+
+
+class WeatherCache:
+    def __init__(self, fetch, ttl=600, bucket_deg=0.1, retry_after=60, max_entries=10000):
+        self.fetch = fetch  # fetch(lat, lon) -> dict, raises on failure
+        self.ttl = ttl
+        self.bucket_deg = bucket_deg
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # bucket -> {'value', 'fetched_at', 'failed_at'}
+        self._refreshing = set()
+        self._failed_misses = {}  # bucket -> time of the last failed cold fetch
+        self._lock = threading.Lock()
+
+    def bucket(self, latitude, longitude):
+        return (round(float(latitude) / self.bucket_deg), round(float(longitude) / self.bucket_deg))
+
+    def get(self, latitude, longitude):
+        # Returns the cached (or freshly fetched) value, or None when nothing
+        # good is known for this bucket yet.
+        key = self.bucket(latitude, longitude)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                stale = now - entry['fetched_at'] > self.ttl
+                recently_failed = now - entry['failed_at'] < self.retry_after
+                if stale and not recently_failed and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, latitude, longitude), daemon=True).start()
+                return entry['value']
+
+            # Don't hammer an upstream that just failed for this bucket
+            if now - self._failed_misses.get(key, 0) < self.retry_after:
+                return None
+
+        # Cold miss: nothing to serve, so this request pays for the fetch
+        try:
+            value = self.fetch(latitude, longitude)
+        except Exception:
+            with self._lock:
+                if len(self._failed_misses) >= self.max_entries:
+                    self._failed_misses.clear()
+                self._failed_misses[key] = time.time()
+            return None
+        self._store(key, value)
+        return value
+
+    def _refresh(self, key, latitude, longitude):
+        try:
+            value = self.fetch(latitude, longitude)
+        except Exception:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['failed_at'] = time.time()
+            return
+        else:
+            self._store(key, value)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = {'value': value, 'fetched_at': time.time(), 'failed_at': 0}
+            self._failed_misses.pop(key, None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failed_misses.clear()